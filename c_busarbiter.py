@@ -0,0 +1,331 @@
+'''
+   Copyright 2026 philippoo66
+
+   Licensed under the GNU GENERAL PUBLIC LICENSE, Version 3 (the "License");
+   you may not use this file except in compliance with the License.
+   You may obtain a copy of the License at
+
+       https://www.gnu.org/licenses/gpl-3.0.html
+
+   Unless required by applicable law or agreed to in writing, software
+   distributed under the License is distributed on an "AS IS" BASIS,
+   WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+   See the License for the specific language governing permissions and
+   limitations under the License.
+'''
+
+# ---------------------------------------------------------------
+# Bus arbiter. Producers (MQTT and TCP requests) submit command
+# strings from any thread and get a Future back. Each source has its
+# own FIFO, the bus owner (the main loop in optolinkvs2_switch) takes
+# one request of a source in that source's slot of its round robin,
+# so a burst of one source does not delay the others, and executes
+# it on the Optolink port between poll items.
+# Reduced scope: polling and Vitoconnect are scheduled by the main
+# loop itself and do not go through here, no priorities, no typed
+# requests. The HTTP API does not use it (answers from memory).
+# Sources may get a limit of waiting requests (set_limit), on
+# overflow 'reject' the new one, 'dropoldest' or 'coalesce' writes
+# to the same datapoint (the new value takes the place of the old).
+# ---------------------------------------------------------------
+
+import threading
+import time
+from collections import deque
+from concurrent.futures import Future
+
+from logger_util import logger
+from c_metrics import metrics, bus_meter
+import requests_util
+import utils
+
+
+# overflow policies of limited sources
+OVERFLOW_POLICIES = ('reject', 'dropoldest', 'coalesce')
+
+cnt_overflow = metrics.counter("bus_queue_overflow_total", "requests rejected, dropped or coalesced because the queue of their source was full", ("source", "action"))
+
+
+class cBusRequest:
+    __slots__ = ('payload', 'source', 'future', 't_submit', 'key')
+
+    def __init__(self, payload, source:str):
+        # command string or parts, see requests_util.response_to_request
+        self.payload = payload
+        self.source = source
+        self.future = Future()
+        self.t_submit = time.monotonic()
+        # (addr, len) of datapoint reads, identical ones share one bus transaction
+        self.key = requests_util.get_read_key(payload)
+
+
+class cBusArbiter:
+    def __init__(self):
+        # source -> deque of its waiting requests
+        self._queues = {}
+        self.num_submitted = 0
+        self.num_executed = 0
+        self.num_failed = 0
+        self.num_cached = 0
+        self.num_coalesced = 0  # requests served by the bus transaction of another one
+        self.num_overflow = 0   # requests rejected, dropped or merged by a source limit
+        # reads queued or on the bus: (addr, len) -> [leading request, requests attached to it]
+        self._reads = {}
+        # limited sources: source -> (maxlen, policy)
+        self._limits = {}
+        self._lock = threading.Lock()
+
+
+    def set_limit(self, source:str, maxlen:int, policy:str='reject'):
+        """ max number of waiting requests of the source, maxlen 0 or None = unlimited """
+        if policy not in OVERFLOW_POLICIES:
+            raise ValueError(f"unknown overflow policy {policy}, use one of {OVERFLOW_POLICIES}")
+        with self._lock:
+            if maxlen:
+                self._limits[source] = (int(maxlen), policy)
+            else:
+                self._limits.pop(source, None)
+
+
+    # --- producer side, any thread ----------------
+    def submit(self, request, source:str='') -> Future:
+        """ request: command string like "read;0x0800;2;0.1" or split parts """
+        if isinstance(request, str) and ('maxage=' in request):
+            # fresh enough in the datapoint cache -> no need to queue
+            result = requests_util.response_from_cache(request)
+            if result is not None:
+                future = Future()
+                future.set_result(result)
+                self.num_cached += 1
+                return future
+        return self._put(request, source)
+
+    def _put(self, payload, source) -> Future:
+        req = cBusRequest(payload, source)
+        self.num_submitted += 1
+        overflow = None     # (future, action) if the source queue is full
+        with self._lock:
+            if req.key is not None:
+                flight = self._reads.get(req.key)
+                if flight is not None:
+                    # same read already queued or on the bus, gets served with it
+                    flight.append(req)
+                    return req.future
+            waiting = self._queues.setdefault(source, deque())
+            limit = self._limits.get(source)
+            if(limit is not None) and (len(waiting) >= limit[0]):
+                overflow = self._overflow(req, waiting, limit[1])
+            queue_it = (overflow is None) or (overflow[1] == 'dropped')
+            if queue_it:
+                waiting.append(req)
+                if req.key is not None:
+                    self._reads[req.key] = [req]
+        if overflow is not None:
+            # outside the lock, done callbacks may take their time
+            self._overflowed(req, *overflow)
+        if queue_it:
+            utils.wakeup_event.set()
+        return req.future
+
+    def _overflow(self, req:cBusRequest, waiting:deque, policy:str) -> tuple:  # (futures to break, action)
+        # under lock
+        if policy == 'dropoldest':
+            old = waiting.popleft()
+            if old.key is not None:
+                # reads coalesced into it would never be served
+                return [w.future for w in self._reads.pop(old.key, [old])], 'dropped'
+            return [old.future], 'dropped'
+        if policy == 'coalesce':
+            addr = requests_util.get_write_addr(req.payload)
+            if addr is not None:
+                for old in reversed(waiting):
+                    if requests_util.get_write_addr(old.payload) == addr:
+                        # new value takes the place of the old one
+                        old_future = old.future
+                        old.payload = req.payload
+                        old.future = req.future
+                        return [old_future], 'coalesced'
+        return [req.future], 'rejected'
+
+    def _overflowed(self, req:cBusRequest, futures:list, action:str):
+        self.num_overflow += 1
+        cnt_overflow.inc(req.source, action)
+        if action == 'coalesced':
+            # not lost, the newer value of the same datapoint gets written instead
+            logger.info(f"{req.source} queue full, write coalesced into {req.payload}")
+            error = Exception(f"{req.source} queue full, superseded by {req.payload}")
+        elif action == 'dropped':
+            # the producer of the oldest gets an error response
+            logger.warning(f"{req.source} queue full, oldest request dropped for {req.payload}")
+            error = Exception(f"{req.source} queue full, request dropped")
+        else:
+            logger.warning(f"{req.source} queue full, request {req.payload} rejected")
+            error = Exception(f"{req.source} queue full, request rejected")
+        for future in futures:
+            if future.set_running_or_notify_cancel():
+                future.set_exception(error)
+
+
+    # --- bus owner side ----------------
+    def pending(self, source:str=None) -> int:     # type: ignore
+        """ all waiting requests, or the ones of the source """
+        if source is not None:
+            return len(self._queues.get(source, ()))
+        return sum(len(waiting) for waiting in list(self._queues.values()))
+
+    def get_nowait(self, source:str=None):     # type: ignore
+        """ next request of the source to execute or None, source None: the oldest of all """
+        # taken under the lock, no coalescing into it anymore
+        with self._lock:
+            if source is None:
+                heads = [waiting for waiting in self._queues.values() if waiting]
+                if not heads:
+                    return None
+                return min(heads, key=lambda waiting: waiting[0].t_submit).popleft()
+            waiting = self._queues.get(source)
+            return waiting.popleft() if waiting else None
+
+    def execute(self, req:cBusRequest, ser) -> int:  # retcode for olbreath
+        bus_meter.source = req.source.lower() or "request"
+        if req.key is not None:
+            return self._execute_read(req, ser)
+        if not req.future.set_running_or_notify_cancel():
+            # cancelled by the producer meanwhile
+            return 0xAB
+        try:
+            result = requests_util.response_to_request(req.payload, ser)
+            self.num_executed += 1
+            req.future.set_result(result)
+            return result[0]
+        except Exception as e:
+            self.num_failed += 1
+            logger.warning(f"Error handling {req.source} request {req.payload}: {e}")
+            req.future.set_exception(e)
+            return 0x01
+
+    def _execute_read(self, req:cBusRequest, ser) -> int:
+        with self._lock:
+            flight = self._reads.get(req.key)
+            if(flight is None) or (flight[0] is not req):
+                # served by a poll read meanwhile
+                return 0xAB
+            if all(waiting.future.cancelled() for waiting in flight):
+                # nobody waiting anymore (cancelled by the producers)
+                del self._reads[req.key]
+                return 0xAB
+        try:
+            result = requests_util.response_to_request(req.payload, ser)
+        except Exception as e:
+            self.num_failed += 1
+            logger.warning(f"Error handling {req.source} request {req.payload}: {e}")
+            for waiting in self._pop_flight(req.key):
+                if waiting.future.set_running_or_notify_cancel():
+                    waiting.future.set_exception(e)
+            return 0x01
+        self.num_executed += 1
+        self._serve_flight(req.key, result[0], result[1], req, result)
+        return result[0]
+
+    def complete_reads(self, addr:int, rlen:int, data):
+        """ successful read by the bus owner itself (poll, Vitoconnect), serves requests waiting for the same """
+        if (addr, rlen) in self._reads:
+            self._serve_flight((addr, rlen), 0x01, data)
+
+    def _pop_flight(self, key) -> list:
+        with self._lock:
+            return self._reads.pop(key, None) or []
+
+    def _serve_flight(self, key, retcode:int, data, leader=None, result=None):
+        # each one gets the response in its own format
+        for waiting in self._pop_flight(key):
+            if not waiting.future.set_running_or_notify_cancel():
+                continue
+            if waiting is leader:
+                waiting.future.set_result(result)
+                continue
+            try:
+                waiting.future.set_result(requests_util.response_from_data(waiting.payload, retcode, data))
+                self.num_coalesced += 1
+            except Exception as e:
+                waiting.future.set_exception(e)
+
+    def cancel_all(self):
+        """ drop everything pending, e.g. on shutdown """
+        while (req := self.get_nowait()) is not None:
+            req.future.cancel()
+            if req.key is not None:
+                for waiting in self._pop_flight(req.key):
+                    waiting.future.cancel()
+
+    def get_stats(self) -> dict:
+        return {"submitted" : self.num_submitted,
+                "executed" : self.num_executed,
+                "failed" : self.num_failed,
+                "from_cache" : self.num_cached,
+                "coalesced" : self.num_coalesced,
+                "overflow" : self.num_overflow,
+                "pending" : self.pending()}
+
+
+# === for global use ================
+bus = cBusArbiter()
+metrics.gauge("bus_queue_depth", "requests waiting for the Optolink bus", bus.pending)
+
+
+
+# ------------------------
+# main for test only - several producers, one bus owner
+# ------------------------
+def main():
+    log = []
+
+    def fake_response(request, ser):
+        # 'bus time', no serial port
+        time.sleep(0.001)
+        log.append(request)
+        return 0x01, bytearray(2), request, request
+
+    requests_util.response_to_request = fake_response
+
+    def producer(name, num):
+        for i in range(num):
+            fut = bus.submit(f"raw;{name}{i}", name)
+            fut.add_done_callback(lambda f: results.append(f.result()))
+
+    results = []
+    threads = [threading.Thread(target=producer, args=(name, 5)) for name in ("MQTT", "TCP")]
+    for t in threads:
+        t.start()
+    # identical reads, one bus transaction
+    reads = [bus.submit("read;0x0800;2;0.1", "MQTT") for _ in range(5)]
+    for t in threads:
+        t.join()
+
+    # one of each source in turn, like the main loop
+    turn = 0
+    while bus.pending():
+        req = bus.get_nowait(("MQTT", "TCP")[turn % 2])
+        turn += 1
+        if req is not None:
+            bus.execute(req, None)
+
+    print("execution order:", [r.split(';')[-1] for r in log])
+    print("read results:", [f.result()[2] for f in reads])
+    print(f"submitted {bus.num_submitted}, executed {bus.num_executed}, coalesced {bus.num_coalesced}, callbacks {len(results)}")
+
+    # slider flooding writes, limited source
+    for policy in OVERFLOW_POLICIES:
+        bus.set_limit("slider", 3, policy)
+        futures = [bus.submit(f"write;{0x2306 + (i % 2):#x};1;{i}", source="slider") for i in range(10)]
+        queued = []
+        while (req := bus.get_nowait()) is not None:
+            if req.future.set_running_or_notify_cancel():
+                queued.append(req.payload.split(';')[-1])
+                req.future.set_result(0x01)
+        states = "".join('.' if f.exception() is None else str(f.exception()).split()[-1][0] for f in futures)
+        print(f"{policy:10s} written values {queued}, requests {states}  (.: written, r: rejected, d: dropped, w: superseded by a newer write)")
+    print("overflow:", cnt_overflow.as_dict())
+
+
+if __name__ == "__main__":
+    main()
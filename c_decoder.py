@@ -0,0 +1,239 @@
+'''
+   Copyright 2026 philippoo66
+
+   Licensed under the GNU GENERAL PUBLIC LICENSE, Version 3 (the "License");
+   you may not use this file except in compliance with the License.
+   You may obtain a copy of the License at
+
+       https://www.gnu.org/licenses/gpl-3.0.html
+
+   Unless required by applicable law or agreed to in writing, software
+   distributed under the License is distributed on an "AS IS" BASIS,
+   WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+   See the License for the specific language governing permissions and
+   limitations under the License.
+'''
+
+# ---------------------------------------------------------------
+# Datapoint decoders. The Scale/Type and bytebit filter spec of a
+# poll item (or read request) gets parsed once into a cDecoder,
+# decoding received data then is a single call.
+# ---------------------------------------------------------------
+
+from functools import lru_cache
+
+from c_settings_adapter import settings
+from logger_util import logger
+import utils
+
+
+# formats with a fixed conversion function, value: data -> value
+FORMAT_FUNCS = {
+    'vdatetime' : utils.vdatetime2str,
+    'vcaldatetime' : lambda data: utils.vdatetime2str(data, 0),
+    'unixtime' : utils.unixtime2str,
+    'schedvdens' : utils.schedvdens2str,
+    'schedvcal' : utils.schedulevcal2str,
+    'utf8' : utils.utf82str,
+    'utf16' : utils.utf162str,
+    'bool' : lambda data: str(int.from_bytes(data, 'little') != 0),
+    'boolinv' : lambda data: str(int.from_bytes(data, 'little') == 0),
+    'onoff' : lambda data: 'ON' if (int.from_bytes(data, 'little') != 0) else 'OFF',
+    'offon' : lambda data: 'ON' if (int.from_bytes(data, 'little') == 0) else 'OFF',
+    'bin' : lambda data: format(int.from_bytes(data, 'little'), f"0{len(data) * 8}b"),
+    'raw' : utils.arr2hexstr,
+}
+
+
+class cDecoder:
+    __slots__ = ('decode', 'valfunc', 'scale', 'signed', 'ffrmt', 'bstart', 'bend', 'imask', 'bigendian')
+
+    def __init__(self, spec):
+        """
+        spec: format part of a poll list entry or split read request (behind Len)
+            (['b:startbyte:lastbyte:bitmask:endian',] [Scale/Type [, Signed]])
+        """
+        self.scale = 1
+        self.signed = False
+        self.ffrmt = ''
+        self.bstart = 0
+        self.bend = 0
+        self.imask = None
+        self.bigendian = False
+
+        numelms = len(spec)
+        offs = 0
+        bbfilter = (numelms > 0) and str(spec[0]).startswith('b:')
+        if bbfilter:
+            self._compile_bytebit(str(spec[0]))
+            offs = 1
+
+        if numelms > offs:
+            if numelms > offs + 1:
+                self.signed = utils.get_bool(spec[offs + 1])
+            self.valfunc = self._compile_format(spec[offs])
+        else:
+            # return raw
+            self.valfunc = utils.arr2hexstr
+
+        # prebind the one to be called
+        self.decode = self._decode_bytebit if bbfilter else self.valfunc
+
+
+    def _compile_bytebit(self, spec:str):
+        # 'b:startbyte:lastbyte:bitmask:endian'
+        bparts = spec.split(':')
+        self.bstart = int(bparts[1])
+        bend = self.bstart
+        if (len(bparts) > 2) and (bparts[2] != ''):
+            bend = int(bparts[2])
+        self.bend = bend + 1  # exclusive
+        if (len(bparts) > 3) and (bparts[3] != ''):
+            self.imask = utils.get_int(str(bparts[3]).strip())
+        self.bigendian = (len(bparts) > 4) and (bparts[4] == 'big')
+
+
+    def _compile_format(self, frmat):
+        scale = utils.to_number(frmat)
+        if scale is not None:
+            self.scale = scale
+            if scale == 1:
+                return self._decode_int
+            return self._decode_scaled
+        frmatl = str(frmat).lower()
+        func = FORMAT_FUNCS.get(frmatl)
+        if func is not None:
+            return func
+        if frmatl.startswith('f:'):
+            self.ffrmt = str(frmat)[2:]
+            return self._decode_fstring
+        logger.error(f"unknown format specifier: {frmat}")
+        return utils.arr2hexstr
+
+
+    # --- decode functions ----------------
+    def _decode_int(self, data):
+        return int.from_bytes(data, 'little', signed=self.signed)
+
+    def _decode_scaled(self, data):
+        return round(int.from_bytes(data, 'little', signed=self.signed) * self.scale, settings.max_decimals)
+
+    def _decode_fstring(self, data):
+        return format(int.from_bytes(data, 'little'), self.ffrmt)
+
+    def filter(self, data):
+        """ apply bytebit filter, returns little endian data """
+        udata = data[self.bstart:self.bend]
+        if self.imask is not None:
+            dlen = len(udata)
+            udata = (int.from_bytes(udata, 'big') & self.imask).to_bytes(dlen, 'big')
+        if self.bigendian:
+            udata = udata[::-1]
+        return udata
+
+    def _decode_bytebit(self, data):
+        return self.valfunc(self.filter(data))
+
+
+def _hashable(elm):
+    # lists of JSON requests (readmulti) as tuples
+    if isinstance(elm, (list, tuple)):
+        return tuple(_hashable(e) for e in elm)
+    if isinstance(elm, dict):
+        return tuple((k, _hashable(v)) for k, v in elm.items())
+    return elm
+
+def get_decoder(spec:tuple) -> cDecoder:
+    """ cached decoder for requests, spec: tuple(parts[3:]) of a split read request """
+    return _get_decoder(_hashable(spec))
+
+@lru_cache(maxsize=256)
+def _get_decoder(spec:tuple) -> cDecoder:
+    return cDecoder(spec)
+
+
+
+# ------------------------
+# main for test only - decode throughput against the former string dispatch
+# ------------------------
+def main():
+    import runpy
+    import time
+
+    def legacy_get_value(data, frmat, signd):
+        # as formerly in requests_util.get_value
+        scale = utils.to_number(frmat)
+        if(scale is not None):
+            return utils.bytesval(data, scale, signd)
+        frmatl = str(frmat).lower()
+        if(frmatl == 'vdatetime'):
+            return utils.vdatetime2str(data)
+        elif(frmatl == 'bool'):
+            return str(utils.bytesval(data) != 0)
+        elif(frmatl == 'onoff'):
+            return 'ON' if(utils.bytesval(data) != 0) else 'OFF'
+        return utils.arr2hexstr(data)
+
+    def legacy_bytebit_filter(data, item):
+        # as formerly in requests_util.perform_bytebit_filter
+        bparts = item[3].split(':')
+        bstart = int(bparts[1])
+        bend = bstart
+        if(len(bparts) > 2):
+            if(bparts[2] != ''):
+                bend = int(bparts[2])
+        udata = data[bstart:(bend+1)]
+        dlen = bend - bstart + 1
+        if(len(bparts) > 3):
+            if(bparts[3] != ''):
+                amask = bytearray(utils.get_int(str(bparts[3]).strip()).to_bytes(dlen, 'big'))
+                for i in range(dlen):
+                    udata[i] = udata[i] & amask[i]
+        if(len(bparts) > 4) and (bparts[4] == 'big'):
+            ival = int.from_bytes(udata, byteorder='big')
+            return bytearray(ival.to_bytes(dlen, byteorder='little'))
+        return udata
+
+    def legacy_decode(data, parts):
+        numelms = len(parts)
+        if(numelms > 3):
+            if(str(parts[3]).startswith('b:')):
+                valdata = legacy_bytebit_filter(data, parts)
+                signd = utils.get_bool(parts[5]) if (numelms > 5) else False
+                return legacy_get_value(valdata, parts[4], signd) if (numelms > 4) else utils.arr2hexstr(valdata)
+            signd = utils.get_bool(parts[4]) if (numelms > 4) else False
+            return legacy_get_value(data, parts[3], signd)
+        return utils.arr2hexstr(data)
+
+    # realistic poll list: the example shipped
+    items = runpy.run_path("poll_list.py.example")["poll_items"]
+    items = [item[1:] if not isinstance(item[1], int) else item for item in items]   # remove PollCycle
+    items = [item for item in items if len(item) > 2]
+    samples = [(bytearray(range(1, int(item[2]) + 1)), item) for item in items]
+    decoders = [cDecoder(item[3:]) for item in items]
+    rounds = 2000
+
+    for (data, item), decoder in zip(samples, decoders):
+        if legacy_decode(bytearray(data), item) != decoder.decode(data):
+            print("MISMATCH", item, legacy_decode(bytearray(data), item), decoder.decode(data))
+
+    t0 = time.perf_counter()
+    for _ in range(rounds):
+        for data, item in samples:
+            legacy_decode(bytearray(data), item)  # legacy filter modifies data in place
+    t_legacy = time.perf_counter() - t0
+
+    t0 = time.perf_counter()
+    for _ in range(rounds):
+        for (data, _), decoder in zip(samples, decoders):
+            decoder.decode(bytearray(data))
+    t_new = time.perf_counter() - t0
+
+    num = rounds * len(samples)
+    print(f"{len(samples)} poll items, {rounds} cycles")
+    print(f"string dispatch : {t_legacy / num * 1e6:6.2f} us/value")
+    print(f"cDecoder        : {t_new / num * 1e6:6.2f} us/value  ({t_legacy / t_new:.1f}x)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,64 @@
+'''
+   Copyright 2026 philippoo66
+
+   Licensed under the GNU GENERAL PUBLIC LICENSE, Version 3 (the "License");
+   you may not use this file except in compliance with the License.
+   You may obtain a copy of the License at
+
+       https://www.gnu.org/licenses/gpl-3.0.html
+
+   Unless required by applicable law or agreed to in writing, software
+   distributed under the License is distributed on an "AS IS" BASIS,
+   WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+   See the License for the specific language governing permissions and
+   limitations under the License.
+'''
+
+# ---------------------------------------------------------------
+# Datapoint cache, raw data of the recent successful reads (poll,
+# requests, Vitoconnect) by (DpAddr, Len). Read requests with
+# 'maxage=<seconds>' get answered from here without bus traffic.
+# ---------------------------------------------------------------
+
+import threading
+import time
+
+
+class cDpCache:
+    def __init__(self):
+        self._entries = {}      # (addr, len) -> (data, monotonic time)
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+
+    def put(self, addr:int, dlen:int, data):
+        with self._lock:
+            self._entries[(addr, dlen)] = (bytes(data), time.monotonic())
+
+    def get(self, addr:int, dlen:int, maxage:float):
+        """ data if not older than maxage seconds, else None """
+        entry = self._entries.get((addr, dlen))
+        if(entry is None) or (time.monotonic() - entry[1] > maxage):
+            return None
+        return entry[0]
+
+    def invalidate(self, addr:int, dlen:int):
+        """ drop everything overlapping addr..addr+dlen-1, e.g. after a write """
+        with self._lock:
+            for key in [key for key in self._entries if (key[0] < addr + dlen) and (addr < key[0] + key[1])]:
+                del self._entries[key]
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+
+    def get_stats(self) -> dict:
+        return {"entries" : len(self._entries),
+                "hits" : self.hits,
+                "misses" : self.misses}
+
+
+# === for global use ================
+dp_cache = cDpCache()
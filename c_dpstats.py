@@ -0,0 +1,165 @@
+'''
+   Copyright 2026 philippoo66
+
+   Licensed under the GNU GENERAL PUBLIC LICENSE, Version 3 (the "License");
+   you may not use this file except in compliance with the License.
+   You may obtain a copy of the License at
+
+       https://www.gnu.org/licenses/gpl-3.0.html
+
+   Unless required by applicable law or agreed to in writing, software
+   distributed under the License is distributed on an "AS IS" BASIS,
+   WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+   See the License for the specific language governing permissions and
+   limitations under the License.
+'''
+
+# ---------------------------------------------------------------
+# Per poll item statistics: round trip time (last/avg/p95 over the
+# recent reads), errors by return code, value changes. For tuning
+# poll_groups: slow or failing items, items which hardly change.
+# command 'dpstats' (JSON), 'dpstats;csv', 'dpstats;save', 'dpstats;reset'
+# ---------------------------------------------------------------
+
+import csv
+import io
+import json
+import threading
+import time
+from collections import deque
+
+from c_metrics import metrics, label_escape
+
+
+# recent round trips kept per item for the p95
+RTT_WINDOW = 100
+
+
+class cItemStats:
+    __slots__ = ('name', 'addr', 'reads', 'last_rtt', 'sum_rtt', 'rtts', 'errors', 'changes', 'last_value', 't_first')
+
+    def __init__(self, name:str, addr):
+        self.name = name
+        self.addr = addr
+        self.reads = 0
+        self.last_rtt = 0.0
+        self.sum_rtt = 0.0
+        self.rtts = deque(maxlen=RTT_WINDOW)
+        self.errors = {}        # retcode -> count
+        self.changes = 0
+        self.last_value = None
+        self.t_first = None     # monotonic time of the first value
+
+
+    def p95(self) -> float:
+        if not self.rtts:
+            return 0.0
+        srt = sorted(self.rtts)
+        return srt[min(len(srt) - 1, int(0.95 * len(srt)))]
+
+    def as_dict(self, now:float) -> dict:
+        hours = (now - self.t_first) / 3600 if self.t_first is not None else 0
+        return {"name" : self.name,
+                "addr" : f"0x{self.addr:04X}" if isinstance(self.addr, int) else str(self.addr),
+                "reads" : self.reads,
+                "rtt_last_ms" : round(self.last_rtt * 1000, 1),
+                "rtt_avg_ms" : round(self.sum_rtt / self.reads * 1000, 1) if self.reads else 0,
+                "rtt_p95_ms" : round(self.p95() * 1000, 1),
+                "errors" : sum(self.errors.values()),
+                "errors_by_retcode" : {f"{rc:02x}": num for rc, num in sorted(self.errors.items())},
+                "changes" : self.changes,
+                "changes_per_hour" : round(self.changes / hours, 2) if hours > 0.01 else None}
+
+
+class cDpStats:
+    CSV_FIELDS = ("name", "addr", "reads", "rtt_last_ms", "rtt_avg_ms", "rtt_p95_ms", "errors", "errors_by_retcode", "changes", "changes_per_hour")
+
+    def __init__(self):
+        self.items = {}     # poll list index -> cItemStats
+        self._lock = threading.Lock()
+
+
+    def _get(self, list_index:int, name:str, addr) -> cItemStats:
+        stats = self.items.get(list_index)
+        if stats is None:
+            with self._lock:
+                stats = self.items.setdefault(list_index, cItemStats(name, addr))
+        return stats
+
+    def read_done(self, list_index:int, name:str, addr, retcode:int, rtt:float):
+        """ a poll read of the item (single or within a block) """
+        stats = self._get(list_index, name, addr)
+        stats.reads += 1
+        stats.last_rtt = rtt
+        stats.sum_rtt += rtt
+        stats.rtts.append(rtt)
+        if retcode != 0x01:
+            stats.errors[retcode] = stats.errors.get(retcode, 0) + 1
+
+    def value(self, list_index:int, name:str, addr, val):
+        """ new value of the item, counts changes """
+        stats = self._get(list_index, name, addr)
+        if stats.t_first is None:
+            stats.t_first = time.monotonic()
+        elif val != stats.last_value:
+            stats.changes += 1
+        stats.last_value = val
+
+    def reset(self):
+        with self._lock:
+            self.items = {}
+
+
+    def as_list(self) -> list:
+        now = time.monotonic()
+        with self._lock:
+            items = sorted(self.items.items())
+        return [stats.as_dict(now) for _, stats in items]
+
+    def to_json(self) -> str:
+        return json.dumps(self.as_list())
+
+    def to_csv(self) -> str:
+        buf = io.StringIO()
+        writer = csv.DictWriter(buf, self.CSV_FIELDS, delimiter=';')
+        writer.writeheader()
+        for row in self.as_list():
+            row["errors_by_retcode"] = " ".join(f"{rc}:{num}" for rc, num in row["errors_by_retcode"].items())
+            writer.writerow(row)
+        return buf.getvalue()
+
+    def save(self, basename:str="dpstats") -> str:
+        """ writes <basename>.csv and <basename>.json, returns what was written """
+        with open(basename + ".csv", "w", newline='') as f:
+            f.write(self.to_csv())
+        with open(basename + ".json", "w") as f:
+            f.write(self.to_json())
+        return f"{basename}.csv, {basename}.json"
+
+
+    def prometheus(self) -> list:
+        """ per item lines for the metrics output """
+        with self._lock:
+            items = [stats for _, stats in sorted(self.items.items())]
+        avg = ["# HELP dp_roundtrip_avg_seconds average read round trip time per datapoint",
+               "# TYPE dp_roundtrip_avg_seconds gauge"]
+        p95 = ["# HELP dp_roundtrip_p95_seconds 95th percentile of the recent read round trip times per datapoint",
+               "# TYPE dp_roundtrip_p95_seconds gauge"]
+        errors = ["# HELP dp_errors_total failed reads per datapoint and return code",
+                  "# TYPE dp_errors_total counter"]
+        changes = ["# HELP dp_changes_total value changes per datapoint",
+                   "# TYPE dp_changes_total counter"]
+        for stats in items:
+            lbl = f'name="{label_escape(stats.name)}"'
+            if stats.reads:
+                avg.append(f"dp_roundtrip_avg_seconds{{{lbl}}} {stats.sum_rtt / stats.reads}")
+                p95.append(f"dp_roundtrip_p95_seconds{{{lbl}}} {stats.p95()}")
+            for retcode, num in sorted(stats.errors.items()):
+                errors.append(f'dp_errors_total{{{lbl},retcode="{retcode:02x}"}} {num}')
+            changes.append(f"dp_changes_total{{{lbl}}} {stats.changes}")
+        return avg + p95 + errors + changes
+
+
+# === for global use ================
+dp_stats = cDpStats()
+metrics.collector(dp_stats.prometheus)
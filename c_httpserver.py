@@ -0,0 +1,206 @@
+'''
+   Copyright 2026 philippoo66
+
+   Licensed under the GNU GENERAL PUBLIC LICENSE, Version 3 (the "License");
+   you may not use this file except in compliance with the License.
+   You may obtain a copy of the License at
+
+       https://www.gnu.org/licenses/gpl-3.0.html
+
+   Unless required by applicable law or agreed to in writing, software
+   distributed under the License is distributed on an "AS IS" BASIS,
+   WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+   See the License for the specific language governing permissions and
+   limitations under the License.
+'''
+
+# ---------------------------------------------------------------
+# Read-only HTTP/JSON API, everything served from memory, no bus
+# traffic:
+#   /values          latest poll values with timestamps
+#   /values/<name>   one of them
+#   /stats           same as the getstats command
+#   /metrics         Prometheus text format
+# HTTP/1.1 keep-alive, ETag / If-None-Match -> 304 Not Modified.
+# settings: http_port
+# ---------------------------------------------------------------
+
+import json
+import zlib
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import unquote
+
+from logger_util import logger
+from c_valuestore import values
+from c_metrics import metrics
+
+
+def _value_dict(entry) -> dict:
+    # entry: (value, DpAddr, epoch time, version)
+    addr = entry[1]
+    return {"value" : entry[0],
+            "addr" : f"0x{addr:04X}" if isinstance(addr, int) else str(addr),
+            "time" : round(entry[2], 3)}
+
+
+class _Handler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"   # keep-alive
+    server_version = "optolink-splitter"
+    timeout = 60                    # idle keep-alive connections get closed
+    disable_nagle_algorithm = True  # headers and body get written separately
+
+    def do_GET(self):
+        self._respond(True)
+
+    def do_HEAD(self):
+        self._respond(False)
+
+    def _respond(self, with_body:bool):
+        try:
+            status, body, ctype, etag = self.server.api.get(self.path)     # type: ignore
+        except Exception as e:
+            logger.warning(f"HTTP {self.path}: {e}")
+            status, body, ctype, etag = 500, str(e).encode(), "text/plain", None
+
+        if etag and (etag in self.headers.get("If-None-Match", "")):
+            self.send_response(304)
+            self.send_header("ETag", etag)
+            self.send_header("Content-Length", "0")
+            self.end_headers()
+            return
+
+        self.send_response(status)
+        self.send_header("Content-Type", ctype)
+        self.send_header("Content-Length", str(len(body)))
+        self.send_header("Cache-Control", "no-cache")
+        if etag:
+            self.send_header("ETag", etag)
+        self.end_headers()
+        if with_body:
+            self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        if self.server.api.verbose:     # type: ignore
+            logger.info(f"HTTP {self.address_string()} {format % args}")
+
+
+class HttpServer:
+    def __init__(self, host:str, port:int, verbose:bool=False):
+        self.host = host
+        self.port = port
+        self.verbose = verbose
+        # callback returning the stats JSON string (getstats)
+        self.stats_callback = None
+        # callback returning the Prometheus text, default: histograms of c_metrics
+        self.metrics_callback = metrics.prometheus
+
+        self._server = None
+        self._values_body = (-1, b"")   # (version, JSON) of the recent /values
+
+
+    # ---------------------------------------------------------
+    # blockiert bis stop()
+    # ---------------------------------------------------------
+    def run(self):
+        try:
+            self._server = ThreadingHTTPServer((self.host, self.port), _Handler)
+        except OSError as e:
+            # e.g. port in use, the rest keeps running without
+            logger.error(f"HTTP Server {self.host}:{self.port} not started: {e}")
+            return
+        self._server.api = self                                 # type: ignore
+        logger.info(f"HTTP Server listening on {self.host}:{self.port}")
+        try:
+            self._server.serve_forever(poll_interval=0.5)
+        finally:
+            self._server.server_close()
+            self._server = None
+
+    def stop(self):
+        """ from another thread than run() """
+        if self._server is not None:
+            logger.info("closing HTTP Server")
+            self._server.shutdown()
+
+
+    # ---------------------------------------------------------
+    # (status, body, content type, etag)
+    # ---------------------------------------------------------
+    def get(self, path:str) -> tuple:
+        path = unquote(path.split("?", 1)[0]).rstrip("/")
+
+        if path == "/values":
+            version = values.version
+            cached = self._values_body
+            if cached[0] != version:
+                version, snapshot = values.snapshot()
+                body = json.dumps({name: _value_dict(entry) for name, entry in snapshot.items()}, default=str).encode()
+                self._values_body = cached = (version, body)
+            return 200, cached[1], "application/json", f'"v{cached[0]}"'
+
+        if path.startswith("/values/"):
+            entry = values.get(path[8:])
+            if entry is None:
+                return 404, b"unknown value\n", "text/plain", None
+            return 200, json.dumps(_value_dict(entry), default=str).encode(), "application/json", f'"v{entry[3]}"'
+
+        if path == "/stats":
+            body = (self.stats_callback() if self.stats_callback else "{}").encode()
+            return 200, body, "application/json", self._etag(body)
+
+        if path == "/metrics":
+            body = self.metrics_callback().encode()
+            return 200, body, "text/plain; version=0.0.4", self._etag(body)
+
+        return 404, b"not found, try /values, /values/<name>, /stats, /metrics\n", "text/plain", None
+
+    @staticmethod
+    def _etag(body:bytes) -> str:
+        return f'"{zlib.crc32(body):08x}"'
+
+
+
+# ------------------------
+# main for test only - keep-alive client polling /values with and without If-None-Match
+# ------------------------
+def main():
+    import http.client
+    import threading
+    import time
+
+    for i in range(30):
+        values.set(f"value_{i}", 0x0800 + 2 * i, i * 0.1)
+
+    server = HttpServer("127.0.0.1", 8088)
+    threading.Thread(target=server.run, daemon=True).start()
+    time.sleep(0.3)
+
+    conn = http.client.HTTPConnection("127.0.0.1", 8088)
+    conn.request("GET", "/values")
+    resp = conn.getresponse()
+    etag = resp.getheader("ETag")
+    print(resp.status, etag, resp.read()[:80])
+
+    for headers in ({}, {"If-None-Match": etag}):
+        num = 500
+        t0 = time.monotonic()
+        for _ in range(num):
+            conn.request("GET", "/values", headers=headers)
+            resp = conn.getresponse()
+            resp.read()
+        dt = time.monotonic() - t0
+        print(f"{num} requests on one connection, status {resp.status}: {dt / num * 1e6:.0f} us/request")
+
+    values.set("value_0", 0x0800, 42)
+    conn.request("GET", "/values/value_0", headers={"If-None-Match": etag})
+    resp = conn.getresponse()
+    print(resp.status, resp.getheader("ETag"), resp.read())
+    conn.request("GET", "/metrics")
+    resp = conn.getresponse()
+    print(resp.status, resp.read()[:60])
+    conn.close()
+    server.stop()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,260 @@
+'''
+   Copyright 2026 philippoo66
+
+   Licensed under the GNU GENERAL PUBLIC LICENSE, Version 3 (the "License");
+   you may not use this file except in compliance with the License.
+   You may obtain a copy of the License at
+
+       https://www.gnu.org/licenses/gpl-3.0.html
+
+   Unless required by applicable law or agreed to in writing, software
+   distributed under the License is distributed on an "AS IS" BASIS,
+   WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+   See the License for the specific language governing permissions and
+   limitations under the License.
+'''
+
+# ---------------------------------------------------------------
+# Runtime metrics (histograms, counters, gauges), cheap enough to be
+# recorded on every telegram. Exposed via the stats commands and
+# the HTTP API /metrics (Prometheus text format).
+# ---------------------------------------------------------------
+
+import bisect
+import threading
+
+
+def label_escape(value) -> str:
+    # label values may contain anything, e.g. poll list names
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+def _labelstr(labels:dict) -> str:
+    # {'retcode': '01'} -> '{retcode="01"}'
+    if not labels:
+        return ''
+    return '{' + ','.join(f'{key}="{label_escape(val)}"' for key, val in labels.items()) + '}'
+
+
+class cHistogram:
+    # upper bounds (seconds) of the buckets, last bucket is +Inf
+    DEFAULT_BOUNDS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0)
+
+    def __init__(self, name:str, helptext:str='', bounds=DEFAULT_BOUNDS, labels:dict=None):     # type: ignore
+        self.name = name
+        self.helptext = helptext
+        self.bounds = tuple(bounds)
+        self.labels = dict(labels or {})
+        self._lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        self.counts = [0] * (len(self.bounds) + 1)
+        self.count = 0
+        self.sum = 0.0
+        self.max = 0.0
+
+    def observe(self, value:float):
+        idx = bisect.bisect_left(self.bounds, value)
+        with self._lock:
+            self.counts[idx] += 1
+            self.count += 1
+            self.sum += value
+            if value > self.max:
+                self.max = value
+
+    def quantile(self, q:float) -> float:
+        """ upper bound of the bucket containing the q-quantile (max if in +Inf bucket) """
+        with self._lock:
+            if self.count == 0:
+                return 0.0
+            rank = q * self.count
+            cum = 0
+            for idx, num in enumerate(self.counts):
+                cum += num
+                if cum >= rank:
+                    return self.bounds[idx] if idx < len(self.bounds) else self.max
+            return self.max
+
+    def as_dict(self) -> dict:
+        with self._lock:
+            count = self.count
+            ret = {"count" : count,
+                   "avg" : round(self.sum / count, 4) if count else 0,
+                   "max" : round(self.max, 4)}
+            cum = 0
+            buckets = {}
+            for bound, num in zip(self.bounds + ("+Inf",), self.counts):
+                cum += num
+                buckets[str(bound)] = cum
+        ret["p50"] = self.quantile(0.5)
+        ret["p99"] = self.quantile(0.99)
+        ret["le"] = buckets
+        return ret
+
+
+class cCounter:
+    """ monotonic counter, optionally by label values """
+    def __init__(self, name:str, helptext:str='', labelnames=()):
+        self.name = name
+        self.helptext = helptext
+        self.labelnames = tuple(labelnames)
+        self.values = {}    # label values tuple -> count
+        self._lock = threading.Lock()
+
+    def inc(self, *labelvalues, amount:float=1):
+        with self._lock:
+            self.values[labelvalues] = self.values.get(labelvalues, 0) + amount
+
+    def total(self) -> float:
+        return sum(self.values.values())
+
+    def as_dict(self) -> dict:
+        if not self.labelnames:
+            return {"total" : round(self.values.get((), 0), 4)}
+        return {",".join(map(str, key)): round(val, 4) for key, val in self.values.items()}
+
+
+class cGauge:
+    """ current value, read from func when rendered """
+    def __init__(self, name:str, helptext:str, func):
+        self.name = name
+        self.helptext = helptext
+        self.func = func
+
+
+class cMetrics:
+    def __init__(self):
+        self.histograms = {}    # name + labels -> cHistogram
+        self.counters = {}
+        self.gauges = {}
+        self.collectors = []    # funcs returning ready Prometheus lines (e.g. per item)
+
+    def histogram(self, name:str, helptext:str='', bounds=cHistogram.DEFAULT_BOUNDS, labels:dict=None) -> cHistogram:     # type: ignore
+        """ get or create """
+        key = name + _labelstr(labels)
+        hist = self.histograms.get(key)
+        if hist is None:
+            hist = self.histograms.setdefault(key, cHistogram(name, helptext, bounds, labels))
+        return hist
+
+    def counter(self, name:str, helptext:str='', labelnames=()) -> cCounter:
+        """ get or create """
+        cnt = self.counters.get(name)
+        if cnt is None:
+            cnt = self.counters.setdefault(name, cCounter(name, helptext, labelnames))
+        return cnt
+
+    def gauge(self, name:str, helptext:str, func) -> cGauge:
+        """ create or replace, func() -> number """
+        gauge = self.gauges[name] = cGauge(name, helptext, func)
+        return gauge
+
+    def collector(self, func):
+        """ func() -> list of Prometheus text lines, appended to the output """
+        self.collectors.append(func)
+
+    def as_dict(self) -> dict:
+        ret = {key: hist.as_dict() for key, hist in self.histograms.items()}
+        ret.update({name: cnt.as_dict() for name, cnt in self.counters.items()})
+        ret.update({name: _gauge_value(gauge) for name, gauge in self.gauges.items()})
+        return ret
+
+    def prometheus(self) -> str:
+        """ Prometheus text exposition format """
+        lines = []
+        done = set()
+        for hist in list(self.histograms.values()):
+            name = hist.name
+            if name not in done:
+                done.add(name)
+                lines.append(f"# HELP {name} {hist.helptext}")
+                lines.append(f"# TYPE {name} histogram")
+            labels = dict(hist.labels)
+            with hist._lock:
+                cum = 0
+                for bound, num in zip(hist.bounds + ("+Inf",), hist.counts):
+                    cum += num
+                    labels["le"] = bound
+                    lines.append(f'{name}_bucket{_labelstr(labels)} {cum}')
+                lines.append(f"{name}_sum{_labelstr(hist.labels)} {hist.sum}")
+                lines.append(f"{name}_count{_labelstr(hist.labels)} {hist.count}")
+        for cnt in list(self.counters.values()):
+            lines.append(f"# HELP {cnt.name} {cnt.helptext}")
+            lines.append(f"# TYPE {cnt.name} counter")
+            with cnt._lock:
+                items = list(cnt.values.items())
+            if(not items) and (not cnt.labelnames):
+                items = [((), 0)]
+            for key, val in items:
+                lines.append(f"{cnt.name}{_labelstr(dict(zip(cnt.labelnames, key)))} {val}")
+        for gauge in list(self.gauges.values()):
+            lines.append(f"# HELP {gauge.name} {gauge.helptext}")
+            lines.append(f"# TYPE {gauge.name} gauge")
+            lines.append(f"{gauge.name} {_gauge_value(gauge)}")
+        for func in self.collectors:
+            try:
+                lines.extend(func())
+            except Exception:
+                pass
+        return "\n".join(lines) + "\n"
+
+
+def _gauge_value(gauge:cGauge):
+    try:
+        return gauge.func()
+    except Exception:
+        return float('nan')
+
+
+class cBusMeter:
+    """
+    Optolink telegrams: count by source, round trip by return code, busy time.
+    The bus owner sets source before a transaction, the receive functions call telegram().
+    """
+    def __init__(self, mtrcs:cMetrics):
+        self.metrics = mtrcs
+        self.source = "other"
+        self.telegrams = mtrcs.counter("optolink_telegrams_total", "Optolink request/response telegrams by source", ("source",))
+        self.busy = mtrcs.counter("optolink_busy_seconds_total", "time spent waiting for Optolink responses, rate() = bus duty cycle")
+        self._roundtrip = {}    # retcode -> cHistogram
+
+    def telegram(self, retcode:int, seconds:float):
+        self.telegrams.inc(self.source)
+        self.busy.inc(amount=seconds)
+        hist = self._roundtrip.get(retcode)
+        if hist is None:
+            hist = self._roundtrip[retcode] = self.metrics.histogram("optolink_roundtrip_seconds",
+                        "request sent until response received, by return code", labels={"retcode" : f"{retcode:02x}"})
+        hist.observe(seconds)
+
+
+# === for global use ================
+metrics = cMetrics()
+bus_meter = cBusMeter(metrics)
+
+
+
+# ------------------------
+# main for test only
+# ------------------------
+def main():
+    import json
+    import random
+    import time
+    hist = metrics.histogram("test_seconds", "test values")
+    for _ in range(1000):
+        hist.observe(random.expovariate(1 / 0.03))
+    print(json.dumps(metrics.as_dict(), indent=2))
+
+    # cost of the hook in the receive functions
+    num = 100000
+    t0 = time.perf_counter()
+    for i in range(num):
+        bus_meter.source = ("poll", "vicon", "mqtt")[i % 3]
+        bus_meter.telegram(0x01 if i % 50 else 0xFF, 0.02)
+    print(f"bus_meter.telegram: {(time.perf_counter() - t0) / num * 1e6:.2f} us per telegram")
+    print(metrics.prometheus())
+
+
+if __name__ == "__main__":
+    main()
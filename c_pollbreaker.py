@@ -0,0 +1,143 @@
+'''
+   Copyright 2026 philippoo66
+
+   Licensed under the GNU GENERAL PUBLIC LICENSE, Version 3 (the "License");
+   you may not use this file except in compliance with the License.
+   You may obtain a copy of the License at
+
+       https://www.gnu.org/licenses/gpl-3.0.html
+
+   Unless required by applicable law or agreed to in writing, software
+   distributed under the License is distributed on an "AS IS" BASIS,
+   WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+   See the License for the specific language governing permissions and
+   limitations under the License.
+'''
+
+# ---------------------------------------------------------------
+# Circuit breaker for poll items failing again and again (ErrMsg,
+# NACK, timeout, ...). After poll_breaker_threshold failures in a row
+# the item gets skipped when due, 1, 2, 4, ... times up to
+# poll_breaker_maxskip. The first poll after the skips is a probe:
+# success closes the breaker, failure doubles the skips.
+# settings: poll_breaker_threshold (0 = off), poll_breaker_maxskip
+# command 'resetbreaker[;name]'
+# ---------------------------------------------------------------
+
+import threading
+
+from c_settings_adapter import settings
+from logger_util import logger
+from c_metrics import metrics
+
+
+class cBreakerState:
+    __slots__ = ('fails', 'skips', 'to_skip', 'num_skipped')
+
+    def __init__(self):
+        self.fails = 0          # failures in a row
+        self.skips = 0          # current backoff, 0 = closed
+        self.to_skip = 0        # due polls still to skip until the next probe
+        self.num_skipped = 0
+
+
+class cPollBreaker:
+    def __init__(self):
+        self.states = {}    # poll list index -> cBreakerState
+        self.num_opened = 0
+        # entries added/removed by the main loop, stats read from other threads (HTTP)
+        self._lock = threading.Lock()
+
+
+    def skip(self, list_index:int) -> bool:
+        """ asked when the item is due, True = do not poll this time """
+        state = self.states.get(list_index)
+        if(state is None) or (state.to_skip <= 0):
+            return False
+        state.to_skip -= 1
+        state.num_skipped += 1
+        return True
+
+    def record(self, list_index:int, retcode:int, name:str=''):
+        """ result of a poll of the item """
+        if retcode == 0x01:
+            with self._lock:
+                state = self.states.pop(list_index, None)
+            if(state is not None) and state.skips:
+                logger.info(f"poll item {name} ok again, breaker closed")
+            return
+        if(retcode == 0xAB) or (settings.poll_breaker_threshold <= 0):
+            # nothing done
+            return
+
+        state = self.states.get(list_index)
+        if state is None:
+            with self._lock:
+                state = self.states[list_index] = cBreakerState()
+        state.fails += 1
+        if state.fails < settings.poll_breaker_threshold:
+            return
+        # open, or probe failed
+        if not state.skips:
+            self.num_opened += 1
+        state.skips = min(max(1, state.skips * 2), max(1, int(settings.poll_breaker_maxskip)))
+        state.to_skip = state.skips
+        logger.warning(f"poll item {name} failed {state.fails}x (RetCode {retcode:02X}), next {state.skips} polls skipped")
+
+    def reset(self, list_index:int=None) -> int:     # type: ignore
+        """ close one or all, returns how many were open """
+        if list_index is None:
+            num = self.num_open()
+            with self._lock:
+                self.states = {}
+            return num
+        with self._lock:
+            state = self.states.pop(list_index, None)
+        return 1 if (state is not None) and state.skips else 0
+
+
+    def num_open(self) -> int:
+        with self._lock:
+            states = list(self.states.values())
+        return sum(1 for state in states if state.skips)
+
+    def get_stats(self, names=None) -> dict:
+        """ names: poll list index -> name """
+        with self._lock:
+            states = sorted(self.states.items())
+        items = {}
+        for idx, state in states:
+            if state.skips:
+                key = names(idx) if names else str(idx)
+                items[key] = {"fails" : state.fails, "skips" : state.skips, "to_skip" : state.to_skip, "skipped" : state.num_skipped}
+        return {"open" : len(items), "opened" : self.num_opened, "items" : items}
+
+
+# === for global use ================
+poll_breaker = cPollBreaker()
+metrics.gauge("poll_breakers_open", "poll items currently skipped for failing (circuit breaker)", poll_breaker.num_open)
+
+
+
+# ------------------------
+# main for test only - item failing 12 times, then ok
+# ------------------------
+def main():
+    settings.poll_breaker_threshold = 3
+    settings.poll_breaker_maxskip = 4
+    polled = []
+    fails = 12
+    for cycle in range(50):
+        if poll_breaker.skip(0):
+            polled.append('-')
+            continue
+        retcode = 0x03 if fails > 0 else 0x01
+        fails -= 1
+        polled.append('x' if retcode != 0x01 else 'o')
+        poll_breaker.record(0, retcode, "test")
+    print("".join(polled), "  x: failed, -: skipped, o: ok")
+    print(poll_breaker.get_stats())
+
+
+if __name__ == "__main__":
+    main()
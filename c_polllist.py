@@ -15,10 +15,13 @@
 '''
 
 import os
+import bisect
 import importlib
 
 from c_settings_adapter import settings
 from logger_util import logger
+from c_decoder import cDecoder
+from c_publishpolicy import make_policies
 import utils
 
 
@@ -31,8 +34,20 @@ class cPollList:
         self.cycle_groups = {}
         self.num_items = 0
         self.module_date = "0"
+        # compiled decoders, same index as items
+        self.decoders = []
+        # compiled publish policies (c_publishpolicy) or None, same index as items
+        self.publish_policies = []
         # datapoint metadata cache for /set topics
         self.datapoint_metadata = {}
+        # block reads: first list index -> (BlockAddr, BlockLen, [list indexes])
+        self.blocks = {}
+        # bytebit items evaluated together with a lead item of same address: lead index -> [list indexes]
+        self.followers = {}
+        # compiled poll plans: frozenset of due cycle group keys -> [list indexes]
+        self._plans = {}
+        # datapoint items sorted by address: [(DpAddr, Len, list index)]
+        self.addr_index = []
 
 
     def make_list(self, reload = False):
@@ -40,6 +55,12 @@ class cPollList:
         self.cycle_groups = {}
         self.num_items = 0
         self.module_date = "0"
+        self.decoders = []
+        self.publish_policies = []
+        self.blocks = {}
+        self.followers = {}
+        self._plans = {}
+        self.addr_index = []
         try:
             # import module where poll list is taken from
             if(os.path.isfile("poll_list.py")):
@@ -87,9 +108,21 @@ class cPollList:
             self.num_items = len(self.items)
             self.module_date = utils.get_module_modified_datetime(listmodule)
 
+            # compile decoders: (PollCycleGroupKey, Name, DpAddr, Len, [bbFilter,] Scale/Type, Signed)
+            self.decoders = [cDecoder(item[4:]) for item in self.items]
+
             # reset cache
             self.datapoint_metadata = {}
 
+            # bytebit followers and block reads
+            self.make_followers()
+            self.make_addr_index()
+            if settings.poll_block_read:
+                self.make_blocks()
+
+            # publish policies by item name or poll group (if exists), bad entries get logged and ignored
+            self.publish_policies = make_policies(self.items, getattr(listmodule, "publish_policies", None) or {})
+
             # apply poll interval if given
             foreign_interval = getattr(listmodule, 'poll_interval', None)
             if foreign_interval is not None:
@@ -101,6 +134,129 @@ class cPollList:
             logger.exception(f"make_list")
 
 
+    def make_followers(self):
+        """
+        Bytebit items directly following an item of same address and length
+        get evaluated from the data read for that item.
+        """
+        self.followers = {}
+
+        def is_bytebit(item) -> bool:
+            # (PollCycleGroupKey, Name, DpAddr, Len, 'b:...', ...)
+            return (len(item) > 4) and str(item[4]).lower().startswith('b:')
+
+        for lstidx in range(self.num_items):
+            item = self.items[lstidx]
+            if not is_bytebit(item):
+                continue
+            nxt = lstidx + 1
+            while (nxt < self.num_items) and is_bytebit(self.items[nxt]) \
+                    and (self.items[nxt][2] == item[2]) and (self.items[nxt][3] == item[3]):
+                nxt += 1
+            if nxt > lstidx + 1:
+                self.followers[lstidx] = list(range(lstidx + 1, nxt))
+
+
+    def make_addr_index(self):
+        # (PollCycleGroupKey, Name, DpAddr, Len, ...), no 1-wire sensors
+        self.addr_index = sorted((item[2], int(item[3]), lstidx) for lstidx, item in enumerate(self.items)
+                                 if (len(item) > 3) and isinstance(item[2], int) and (item[2] not in settings.w1sensors))
+
+
+    def find_covered(self, addr:int, dlen:int) -> list:
+        """ list indexes of the items completely inside addr..addr+dlen-1 """
+        ret = []
+        pos = bisect.bisect_left(self.addr_index, (addr,))
+        while (pos < len(self.addr_index)) and (self.addr_index[pos][0] < addr + dlen):
+            iaddr, ilen, lstidx = self.addr_index[pos]
+            if iaddr + ilen <= addr + dlen:
+                ret.append(lstidx)
+            pos += 1
+        return ret
+
+
+    def make_blocks(self):
+        """
+        Find consecutive items of the same cycle group with adjacent or overlapping 
+        address ranges to get read in one telegram.
+        """
+        self.blocks = {}
+        maxgap = int(settings.poll_block_maxgap)
+        maxlen = min(int(settings.poll_block_maxlen), 255)
+        blacklist = set(utils.get_int(a) for a in settings.poll_block_blacklist)
+
+        def blockable(item) -> bool:
+            # (PollCycleGroupKey, Name, DpAddr, Len, ...)
+            if (len(item) < 4) or (item[2] in settings.w1sensors) or (item[2] in blacklist):
+                return False
+            return (0 < int(item[3]) <= maxlen)
+
+        lstidx = 0
+        while lstidx < self.num_items:
+            first = self.items[lstidx]
+            if not blockable(first):
+                lstidx += 1
+                continue
+            baddr = first[2]
+            bend = baddr + int(first[3])   # exclusive
+            members = [lstidx]
+            nxt = lstidx + 1
+            while nxt < self.num_items:
+                item = self.items[nxt]
+                if (not blockable(item)) or (item[0] != first[0]):
+                    break
+                addr = item[2]
+                if (addr < baddr) or (addr - bend > maxgap):
+                    break
+                newend = max(bend, addr + int(item[3]))
+                if newend - baddr > maxlen:
+                    break
+                if any((baddr <= a < newend) for a in blacklist):
+                    break
+                bend = newend
+                members.append(nxt)
+                nxt += 1
+            # same address only (bytebit filters) gets handled without block
+            if len(set(self.items[i][2] for i in members)) > 1:
+                self.blocks[lstidx] = (baddr, bend - baddr, members)
+                lstidx = nxt
+            else:
+                lstidx += 1
+        if self.blocks:
+            logger.info(f"poll_list: {len(self.blocks)} block reads covering {sum(len(b[2]) for b in self.blocks.values())} items")
+
+
+    def drop_block(self, lstidx:int):
+        """ dissolve a block, e.g. if the device refuses to read it """
+        block = self.blocks.pop(lstidx, None)
+        if block:
+            self._plans = {}
+            logger.warning(f"poll_list: block read 0x{block[0]:04X}/{block[1]} dissolved, items get polled one by one")
+
+
+    def get_plan(self, poll_cycle:int) -> list:
+        """
+        List indexes of the items to get polled in poll_cycle, in list order.
+        Followers and block members are covered by their lead item. 
+        Plans only depend on the cycle groups due, so they get compiled once and cached.
+        """
+        due = frozenset(key for key, cyc in self.cycle_groups.items()
+                        if ((cyc > 0) and (poll_cycle % cyc == 0)) or ((cyc == 0) and (poll_cycle == 0)))
+        plan = self._plans.get(due)
+        if plan is None:
+            plan = []
+            lstidx = 0
+            while lstidx < self.num_items:
+                if self.items[lstidx][0] in due:
+                    plan.append(lstidx)
+                    # continue after the last item covered: block members and followers of each
+                    covered = self.blocks[lstidx][2] if (lstidx in self.blocks) else [lstidx]
+                    lstidx = max(self.followers.get(idx, [idx])[-1] for idx in covered)
+                lstidx += 1
+            self._plans[due] = plan
+        return plan
+
+
     def set_pollcycle(self, group_key:str, value) -> bool:
         if group_key not in self.cycle_groups:
             return False
@@ -109,6 +265,8 @@ class cPollList:
         except:
             return False
         self.cycle_groups[group_key] = cyc
+        # plans to get re-compiled
+        self._plans = {}
         return True
 
 
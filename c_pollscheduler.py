@@ -0,0 +1,150 @@
+'''
+   Copyright 2026 philippoo66
+
+   Licensed under the GNU GENERAL PUBLIC LICENSE, Version 3 (the "License");
+   you may not use this file except in compliance with the License.
+   You may obtain a copy of the License at
+
+       https://www.gnu.org/licenses/gpl-3.0.html
+
+   Unless required by applicable law or agreed to in writing, software
+   distributed under the License is distributed on an "AS IS" BASIS,
+   WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+   See the License for the specific language governing permissions and
+   limitations under the License.
+'''
+
+# ---------------------------------------------------------------
+# Poll cycle scheduler, asked by the main loop (no timer thread).
+# Cycles are anchored to absolute monotonic times start + n * interval,
+# so the cycle duration does not add up to drift.
+# settings: poll_interval, poll_overrun_policy
+# ---------------------------------------------------------------
+
+import time
+
+from c_settings_adapter import settings
+from logger_util import logger
+from c_metrics import metrics
+
+
+# what to do if a cycle took longer than poll_interval
+OVERRUN_SKIP = 'skip'           # start with the next slot of the grid, missed ones are dropped
+OVERRUN_CATCHUP = 'catchup'     # start missed cycles right away until back on the grid
+OVERRUN_STRETCH = 'stretch'     # start next cycle right away, grid gets re-anchored to it
+
+
+class cPollScheduler:
+    def __init__(self):
+        self.next_due = None    # monotonic time the next cycle is due, None = not started
+        self.due = 0.0          # grid time of the running cycle
+        self.cycle_start = 0.0  # monotonic time the running cycle actually started
+        self.num_cycles = 0
+        self.num_overruns = 0
+        self.num_skipped = 0
+        self.last_duration = 0.0
+        self.hist_cycle = metrics.histogram("poll_cycle_seconds", "duration of a poll cycle",
+                                            (0.5, 1, 2, 5, 10, 20, 30, 60, 120, 300))
+
+
+    def start(self, now=None):
+        """ first cycle due immediately """
+        self.next_due = time.monotonic() if now is None else now
+
+    def stop(self):
+        self.next_due = None
+
+
+    def is_due(self, now=None) -> bool:
+        if(self.next_due is None) or (settings.poll_interval < 0):
+            return False
+        if now is None:
+            now = time.monotonic()
+        return now >= self.next_due
+
+    def time_to_due(self, now=None) -> float:  # seconds, inf if not scheduled
+        if(self.next_due is None) or (settings.poll_interval < 0):
+            return float('inf')
+        if now is None:
+            now = time.monotonic()
+        return max(0.0, self.next_due - now)
+
+
+    def cycle_started(self, now=None):
+        if now is None:
+            now = time.monotonic()
+        self.cycle_start = now
+        # grid slot of this cycle (forced cycles count from now)
+        self.due = self.next_due if (self.next_due is not None) and (self.next_due <= now) else now
+
+    def cycle_done(self, now=None):
+        if now is None:
+            now = time.monotonic()
+        self.num_cycles += 1
+        self.last_duration = now - self.cycle_start
+        self.hist_cycle.observe(self.last_duration)
+
+        interval = settings.poll_interval
+        if(interval <= 0):
+            # continuous polling (or disabled)
+            self.next_due = now
+            return
+
+        self.next_due = self.due + interval
+        if(now <= self.next_due):
+            return
+
+        # behind the grid
+        missed = int((now - self.due) // interval)
+        policy = str(settings.poll_overrun_policy).lower()
+        if(self.last_duration > interval):
+            # overrun by the cycle itself, not only started late (e.g. catching up)
+            self.num_overruns += 1
+            logger.warning(f"poll cycle overrun: {self.last_duration:.1f}s (poll_interval {interval}s), policy {policy}")
+        if(policy == OVERRUN_CATCHUP):
+            pass  # next_due in the past -> starts right away
+        elif(policy == OVERRUN_STRETCH):
+            self.next_due = now
+        else:
+            self.num_skipped += missed
+            self.next_due = self.due + (missed + 1) * interval
+
+
+    def get_stats(self) -> dict:
+        return {"cycles" : self.num_cycles,
+                "overruns" : self.num_overruns,
+                "skipped" : self.num_skipped}
+
+
+# === for global use ================
+poll_scheduler = cPollScheduler()
+metrics.gauge("poll_cycle_last_seconds", "duration of the recent poll cycle", lambda: poll_scheduler.last_duration)
+metrics.gauge("poll_interval_seconds", "poll_interval setting, cycle duration beyond it is an overrun", lambda: settings.poll_interval)
+metrics.gauge("poll_overruns", "poll cycles longer than poll_interval since start", lambda: poll_scheduler.num_overruns)
+
+
+
+# ------------------------
+# main for test only - simulated clock, cycle duration varies
+# ------------------------
+def main():
+    settings.poll_interval = 10
+    durations = [3, 4, 12, 3, 25, 3, 3, 3]
+
+    for policy in (OVERRUN_SKIP, OVERRUN_CATCHUP, OVERRUN_STRETCH):
+        settings.poll_overrun_policy = policy
+        sched = cPollScheduler()
+        now = 1000.0
+        sched.start(now)
+        starts = []
+        for dur in durations:
+            now = max(now, sched.next_due)     # main loop idles until due
+            sched.cycle_started(now)
+            starts.append(now - 1000.0)
+            now += dur
+            sched.cycle_done(now)
+        print(f"{policy:8s} starts {starts}  {sched.get_stats()}")
+
+
+if __name__ == "__main__":
+    main()
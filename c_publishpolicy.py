@@ -0,0 +1,132 @@
+'''
+   Copyright 2026 philippoo66
+
+   Licensed under the GNU GENERAL PUBLIC LICENSE, Version 3 (the "License");
+   you may not use this file except in compliance with the License.
+   You may obtain a copy of the License at
+
+       https://www.gnu.org/licenses/gpl-3.0.html
+
+   Unless required by applicable law or agreed to in writing, software
+   distributed under the License is distributed on an "AS IS" BASIS,
+   WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+   See the License for the specific language governing permissions and
+   limitations under the License.
+'''
+
+# ---------------------------------------------------------------
+# Publish policies of poll items, declared in the poll list module:
+#   publish_policies = {
+#       "outside_temperature" : {"deadband" : 0.3, "min_interval" : 300, "heartbeat" : 3600},
+#       "OFTEN" : {"deadband_pct" : 2},     # poll group: all items of the group
+#   }
+#   deadband      publish only if differing more than this from the value published last
+#   deadband_pct  same, relative to the value published last [%]
+#   min_interval  seconds at least between two publishes
+#   heartbeat     seconds after which the value gets published anyway
+# Non-numeric values: any change counts. Compiled once per poll
+# list (c_polllist), evaluated for each new value.
+# ---------------------------------------------------------------
+
+import time
+
+from logger_util import logger
+from c_metrics import metrics
+
+
+POLICY_KEYS = ("deadband", "deadband_pct", "min_interval", "heartbeat")
+
+cnt_policy_suppressed = metrics.counter("mqtt_policy_suppressed_total", "poll values not published because of the publish policy of the item")
+
+
+class cPublishPolicy:
+    __slots__ = ('deadband', 'deadband_rel', 'min_interval', 'heartbeat', 'last_value', 'last_time')
+
+    def __init__(self, deadband:float=0, deadband_pct:float=0, min_interval:float=0, heartbeat:float=0):
+        self.deadband = float(deadband)
+        self.deadband_rel = float(deadband_pct) / 100
+        self.min_interval = float(min_interval)
+        self.heartbeat = float(heartbeat)
+        self.last_value = None  # published last
+        self.last_time = None   # monotonic
+
+
+    def check(self, val, now:float=None) -> int:     # type: ignore
+        """ 0: not to publish, 1: publish, 2: publish even if unchanged (heartbeat) """
+        if now is None:
+            now = time.monotonic()
+        if self.last_time is None:
+            ret = 1
+        elif self.heartbeat and (now - self.last_time >= self.heartbeat):
+            ret = 2
+        elif (now - self.last_time < self.min_interval) or not self.changed(val):
+            cnt_policy_suppressed.inc()
+            return 0
+        else:
+            ret = 1
+        self.last_value = val
+        self.last_time = now
+        return ret
+
+    def changed(self, val) -> bool:
+        last = self.last_value
+        if isinstance(val, (int, float)) and isinstance(last, (int, float)) \
+                and not isinstance(val, bool) and not isinstance(last, bool):
+            return abs(val - last) > max(self.deadband, abs(last) * self.deadband_rel)
+        return val != last
+
+    def published(self, val):
+        """ published by other means (e.g. forced read back) """
+        self.last_value = val
+        self.last_time = time.monotonic()
+
+
+def check_policy(key, policy) -> bool:
+    """ entry of publish_policies usable, else logged """
+    try:
+        if not isinstance(policy, dict):
+            raise ValueError("not a dict")
+        unknown = set(policy) - set(POLICY_KEYS)
+        if unknown:
+            raise ValueError(f"unknown {sorted(unknown)}, use {POLICY_KEYS}")
+        cPublishPolicy(**policy)
+        return True
+    except (ValueError, TypeError) as e:
+        logger.error(f"publish_policies {key}: {e} - ignored")
+        return False
+
+def make_policies(items:list, policies:dict) -> list:
+    """ items: (PollCycleGroupKey, Name, ...); returns cPublishPolicy or None for each item, bad entries ignored """
+    if not isinstance(policies, dict):
+        logger.error("publish_policies: not a dict - ignored")
+        policies = {}
+    policies = {key: policy for key, policy in policies.items() if check_policy(key, policy)}
+    ret = []
+    for item in items:
+        # own entry first, then its poll group
+        policy = policies.get(item[1], policies.get(item[0]))
+        ret.append(cPublishPolicy(**policy) if policy else None)
+    return ret
+
+
+
+# ------------------------
+# main for test only - noisy temperature polled every 30 s for one day
+# ------------------------
+def main():
+    import random
+    random.seed(1)
+    policy = cPublishPolicy(deadband=0.3, min_interval=300, heartbeat=3600)
+    temp = 5.0
+    num = 0
+    num_published = 0
+    for t in range(0, 24 * 3600, 30):
+        temp += random.choice((-0.1, 0, 0.1))
+        num += 1
+        if policy.check(round(temp, 1), t):
+            num_published += 1
+    print(f"{num} values, {num_published} published")
+
+
+if __name__ == "__main__":
+    main()
@@ -61,11 +61,17 @@ class SettingsAdapter:
         self.mqtt_fstr = "{dpname}"             # Format string for MQTT messages (default: "{dpname}", alternative e.g.: "{dpaddr:04X}_{dpname}")
         self.mqtt_retain = False                # Publish retained messages. Last message per topic is stored on broker and sent to new/reconnecting subscribers. (default: False)
         self.mqtt_no_redundant = False          # if True, no previously published unchanged messages 
+        self.mqtt_queue_size = 50               # max number of MQTT commands waiting for the Optolink bus, 0 for unlimited (default: 50)
+        self.mqtt_queue_policy = 'coalesce'     # if full: 'reject' new commands, 'dropoldest', or 'coalesce' writes to the same datapoint (default: 'coalesce')
+        self.mqtt_publish_mode = 'topics'       # poll values: 'topics' each on its own topic, 'json' one JSON of the changed ones per poll cycle on {mqtt_topic}/state, 'both' (default: 'topics')
 
         # TCP/IP ++++++++++++++++++++++++++
         self.tcpip_port =  65234                # TCP/IP port for communication (default: 65234, used by Viessdata; set None to disable TCP/IP)
         self.tcp_verbose = False                # TCP verbose logging if True
 
+        # HTTP API ++++++++++++++++++++++++
+        self.http_port = None                   # HTTP port for the read-only JSON API /values, /stats, /metrics (default: None = disabled, e.g. 8080)
+
         # Optolink Communication Timing ++++
         self.fullraw_eot_time =  0.05           # Timeout (seconds) to determine end of telegram (default: 0.05)
         self.fullraw_timeout =  2               # Overall timeout (seconds) for receiving data (default: 2)
@@ -76,6 +82,8 @@ class SettingsAdapter:
         self.log_optolink = False               # Enable logging of Optolink rx+tx communication (default: False)
         self.log_vitoconnect = False            # Enable logging of Vitoconnect Optolink rx+tx telegram communication (default: False)
         self.viconn_to_mqtt = True              # Vitoconnect traffic published on MQTT
+        self.viconn_strict_priority = True      # if True, Vitoconnect requests get served also while waiting for 1-wire sensors (default: True)
+        self.viconn_harvest = False             # if True, poll items read by Vitoconnect anyway get taken from its responses and skipped in the poll cycle (default: False)
 
         # Data Formatting +++++++++++++++
         self.max_decimals = 4                   # Max decimal places for float values (default: 4)
@@ -98,6 +106,7 @@ class SettingsAdapter:
         self.max_comm_errors = 10               # optolink comm error threshold to init restart
         self.retry_counters_reset = 30          # minutes of sucessful operation to reset the retry counters 
         self.readback_delay_set = 1             # seconds delay between wirte via /set and reading back 
+        self.set_debounce = 0                   # seconds without further /set of the same datapoint until the latest value gets written, 0: write each (default: 0)
 
         # special for wo1c: read daily/weekly energy statistics +++++++++++
         self.wo1c_energy = 0                    # 0:disabled, €N: every n-th cycle
@@ -107,6 +116,13 @@ class SettingsAdapter:
 
         # Datapoint Polling List +++++++++
         self.poll_interval = 30                 # Polling interval (seconds), 0 for continuous, -1 to disable (default: 30)
+        self.poll_overrun_policy = 'skip'       # if a poll cycle takes longer than poll_interval: 'skip' missed cycles, 'catchup' or 'stretch' the interval (default: 'skip')
+        self.poll_block_read = False            # if True, neighbouring poll items of the same cycle group get read in one telegram (default: False)
+        self.poll_block_maxgap = 0              # max unused bytes between two datapoints within one block read (default: 0)
+        self.poll_block_maxlen = 32             # max number of bytes of one block read (default: 32)
+        self.poll_block_blacklist = []          # addresses never to be read within a block (default: [])
+        self.poll_breaker_threshold = 0         # failures in a row until a poll item gets skipped (circuit breaker), 0: disabled (default: 0)
+        self.poll_breaker_maxskip = 16          # max number of due polls skipped between two probes of a failing item (default: 16)
 
         # ~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~
         #  now we apply given settings from settings_ini.py or any other parser
@@ -147,6 +163,8 @@ class SettingsAdapter:
         self.max_vicon_tries = getattr(self._settings_obj, 'max_vicon_tries', self.max_vicon_tries)
         self.max_comm_errors = getattr(self._settings_obj, 'max_comm_errors', self.max_comm_errors)               
         self.retry_counters_reset = getattr(self._settings_obj, 'retry_counters_reset', self.retry_counters_reset)               
+        self.readback_delay_set = getattr(self._settings_obj, 'readback_delay_set', self.readback_delay_set)
+        self.set_debounce = getattr(self._settings_obj, 'set_debounce', self.set_debounce)
 
         # Serial Ports +++++++++++++++++++
         self.port_optolink = getattr(self._settings_obj, 'port_optolink', self.port_optolink)
@@ -172,11 +190,17 @@ class SettingsAdapter:
         self.mqtt_fstr = getattr(self._settings_obj, 'mqtt_fstr',self.mqtt_fstr)
         self.mqtt_retain = getattr(self._settings_obj, 'mqtt_retain', self.mqtt_retain)
         self.mqtt_no_redundant = getattr(self._settings_obj, 'mqtt_no_redundant', self.mqtt_no_redundant)
+        self.mqtt_queue_size = getattr(self._settings_obj, 'mqtt_queue_size', self.mqtt_queue_size)
+        self.mqtt_queue_policy = getattr(self._settings_obj, 'mqtt_queue_policy', self.mqtt_queue_policy)
+        self.mqtt_publish_mode = getattr(self._settings_obj, 'mqtt_publish_mode', self.mqtt_publish_mode)
 
         # TCP/IP ++++++++++++++++++++++++++
         self.tcpip_port = getattr(self._settings_obj, 'tcpip_port', self.tcpip_port)
         self.tcp_verbose = getattr(self._settings_obj, 'tcp_verbose', self.tcp_verbose)
 
+        # HTTP API ++++++++++++++++++++++++
+        self.http_port = getattr(self._settings_obj, 'http_port', self.http_port)
+
         # Optolink Communication Timing ++++
         self.fullraw_eot_time = getattr(self._settings_obj, 'fullraw_eot_time', self.fullraw_eot_time)
         self.fullraw_timeout = getattr(self._settings_obj, 'fullraw_timeout', self.fullraw_timeout)
@@ -187,6 +211,8 @@ class SettingsAdapter:
         self.log_optolink = getattr(self._settings_obj, 'log_optolink', self.log_optolink)
         self.log_vitoconnect = getattr(self._settings_obj, 'log_vitoconnect', self.log_vitoconnect)
         self.viconn_to_mqtt = getattr(self._settings_obj, 'viconn_to_mqtt', self.viconn_to_mqtt)
+        self.viconn_strict_priority = getattr(self._settings_obj, 'viconn_strict_priority', self.viconn_strict_priority)
+        self.viconn_harvest = getattr(self._settings_obj, 'viconn_harvest', self.viconn_harvest)
 
         # Data Formatting +++++++++++++++
         self.max_decimals = getattr(self._settings_obj, 'max_decimals', self.max_decimals)
@@ -210,6 +236,13 @@ class SettingsAdapter:
         foreign_interval = getattr(self._settings_obj, 'poll_interval', None)
         if foreign_interval is not None:
             self.poll_interval = foreign_interval
+        self.poll_overrun_policy = getattr(self._settings_obj, 'poll_overrun_policy', self.poll_overrun_policy)
+        self.poll_block_read = getattr(self._settings_obj, 'poll_block_read', self.poll_block_read)
+        self.poll_block_maxgap = getattr(self._settings_obj, 'poll_block_maxgap', self.poll_block_maxgap)
+        self.poll_block_maxlen = getattr(self._settings_obj, 'poll_block_maxlen', self.poll_block_maxlen)
+        self.poll_block_blacklist = getattr(self._settings_obj, 'poll_block_blacklist', self.poll_block_blacklist)
+        self.poll_breaker_threshold = getattr(self._settings_obj, 'poll_breaker_threshold', self.poll_breaker_threshold)
+        self.poll_breaker_maxskip = getattr(self._settings_obj, 'poll_breaker_maxskip', self.poll_breaker_maxskip)
 
 
 # === for global use ==================
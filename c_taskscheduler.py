@@ -0,0 +1,159 @@
+'''
+   Copyright 2026 philippoo66
+
+   Licensed under the GNU GENERAL PUBLIC LICENSE, Version 3 (the "License");
+   you may not use this file except in compliance with the License.
+   You may obtain a copy of the License at
+
+       https://www.gnu.org/licenses/gpl-3.0.html
+
+   Unless required by applicable law or agreed to in writing, software
+   distributed under the License is distributed on an "AS IS" BASIS,
+   WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+   See the License for the specific language governing permissions and
+   limitations under the License.
+'''
+
+# ---------------------------------------------------------------
+# Delayed tasks (read back after /set, /set debounce, retry counter
+# reset, ...) in one heap instead of a thread per task. Any thread
+# may schedule, the main loop runs the due ones (run_due) and sleeps
+# at most time_to_next(). Tasks must not block.
+# A task with the key of a waiting one replaces it (new time, new
+# function), so bursts end up in one execution.
+# ---------------------------------------------------------------
+
+import heapq
+import itertools
+import threading
+import time
+
+from logger_util import logger
+from c_metrics import metrics
+import utils
+
+
+class cTask:
+    __slots__ = ('due', 'seq', 'key', 'func', 'cancelled')
+
+    def __init__(self, due:float, seq:int, key, func):
+        self.due = due
+        self.seq = seq
+        self.key = key
+        self.func = func
+        self.cancelled = False
+
+    def __lt__(self, other):
+        return (self.due, self.seq) < (other.due, other.seq)
+
+
+class cTaskScheduler:
+    def __init__(self):
+        self._heap = []
+        self._keys = {}     # key -> waiting cTask
+        self._seq = itertools.count()
+        self._lock = threading.Lock()
+        self.num_done = 0
+        self.num_replaced = 0
+
+
+    def call_later(self, delay:float, func, key=None) -> bool:
+        """ func() after delay seconds, returns True if a waiting task with the same key got replaced """
+        return self.call_at(time.monotonic() + delay, func, key)
+
+    def call_at(self, due:float, func, key=None) -> bool:
+        """ due: time.monotonic() based """
+        task = cTask(due, next(self._seq), key, func)
+        with self._lock:
+            replaced = False
+            if key is not None:
+                old = self._keys.get(key)
+                if old is not None:
+                    # stays in the heap until due, gets skipped
+                    old.cancelled = True
+                    replaced = True
+                    self.num_replaced += 1
+                self._keys[key] = task
+            heapq.heappush(self._heap, task)
+            earliest = self._heap[0] is task
+        if earliest:
+            # main loop might sleep longer
+            utils.wakeup_event.set()
+        return replaced
+
+    def cancel(self, key) -> bool:
+        with self._lock:
+            task = self._keys.pop(key, None)
+            if task is not None:
+                task.cancelled = True
+        return task is not None
+
+    def cancel_kind(self, kind):
+        """ all with key (kind, ...) """
+        with self._lock:
+            for key in [key for key in self._keys if isinstance(key, tuple) and key[0] == kind]:
+                self._keys.pop(key).cancelled = True
+
+
+    # --- main loop side ----------------
+    def time_to_next(self) -> float:
+        """ seconds until the next task is due, inf if none """
+        with self._lock:
+            while self._heap and self._heap[0].cancelled:
+                heapq.heappop(self._heap)
+            if not self._heap:
+                return float('inf')
+            return max(0.0, self._heap[0].due - time.monotonic())
+
+    def run_due(self) -> int:
+        """ runs the tasks due, returns how many """
+        num = 0
+        now = time.monotonic()
+        while True:
+            with self._lock:
+                if(not self._heap) or (self._heap[0].due > now):
+                    break
+                task = heapq.heappop(self._heap)
+                if task.cancelled:
+                    continue
+                if task.key is not None:
+                    del self._keys[task.key]
+            try:
+                task.func()
+            except Exception as e:
+                logger.error(f"Error task {task.key}: {e}")
+            num += 1
+        self.num_done += num
+        return num
+
+    def pending(self) -> int:
+        return len(self._keys) + sum(1 for task in list(self._heap) if task.key is None and not task.cancelled)
+
+    def get_stats(self) -> dict:
+        return {"pending" : self.pending(), "done" : self.num_done, "replaced" : self.num_replaced}
+
+
+# === for global use ================
+task_scheduler = cTaskScheduler()
+metrics.gauge("scheduled_tasks", "delayed tasks waiting (read back, /set debounce, ...)", task_scheduler.pending)
+
+
+
+# ------------------------
+# main for test only - burst of 1000 delayed read backs for 3 items, no thread each
+# ------------------------
+def main():
+    done = []
+    t0 = time.monotonic()
+    for i in range(1000):
+        task_scheduler.call_later(0.05 + i * 0.0001, lambda i=i: done.append(i % 3), key=("readback", i % 3))
+    print(f"scheduled 1000 in {(time.monotonic() - t0) * 1000:.1f} ms, {threading.active_count()} thread(s), {task_scheduler.get_stats()}")
+    while task_scheduler.time_to_next() != float('inf'):
+        utils.wakeup_event.wait(task_scheduler.time_to_next())
+        utils.wakeup_event.clear()
+        task_scheduler.run_due()
+    print(f"done {done} after {(time.monotonic() - t0) * 1000:.0f} ms, {task_scheduler.get_stats()}")
+
+
+if __name__ == "__main__":
+    main()
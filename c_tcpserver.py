@@ -1,4 +1,6 @@
-import socket
+import asyncio
+import threading
+import time
 
 from logger_util import logger
 import utils
@@ -6,161 +8,233 @@ import utils
 #logger = logging.getLogger(__name__)
 #logger = logging.getLogger("tcptest.txt")
 
+# max requests buffered per client, reading pauses (TCP backpressure) if full
+CLIENT_QUEUE_SIZE = 64
+# a message without line end is taken as complete after this idle time (clients sending without '\n')
+UNTERMINATED_TIMEOUT = 0.3
+# bytes waiting to be sent to a client, beyond that it does not read its responses and gets closed
+CLIENT_WRITE_HIGH_WATER = 256 * 1024
+
+
+class TcpClient:
+    def __init__(self, reader, writer):
+        self.reader = reader
+        self.writer = writer
+        self.address = writer.get_extra_info("peername")
+        # requests of this client, served one after the other -> responses in order
+        self.queue = asyncio.Queue(CLIENT_QUEUE_SIZE)
+        self.closing = False
+
+
 class TcpServer:
     def __init__(self, host: str, port: int, verbose: bool = False):
         self.host = host
         self.port = port
         self.verbose = verbose
-        # callback for 'special' commands
-        self.command_callback = None  
-
-        self.server_socket = None
-        self.client_socket = None
-        self.client_address = None
+        # callback for 'special' commands: (cmnd, source) -> True if handled, responds via send()
+        self.command_callback = None
+        # callback for requests: (msg) -> Future (bus arbiter), result (retcode, data, value, response string)
+        self.request_callback = None
 
-        self.received_data = ""
+        self.clients = set()
         self.exit_flag = False
 
+        self._loop = None
+        self._loop_thread = None
+        self._stop_event = None
+        # client whose command_callback is running (in an executor thread)
+        self._current = threading.local()
+
     # ---------------------------------------------------------
-    # Startet den Server
+    # Startet den Server, kehrt erst nach stop() zurueck
     # ---------------------------------------------------------
     def run(self):
         self.exit_flag = False
-        self.received_data = ""
-
-        self.server_socket = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
-
-        # Sofortige Port-Wiederverwendung
-        self.server_socket.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
-
-        # Binden + Listen
-        self.server_socket.bind((self.host, self.port))
-        self.server_socket.listen(1)
+        try:
+            asyncio.run(self._serve())
+        except Exception:
+            logger.exception("TCP Server")
+        finally:
+            self._loop = None
+            self.exit_flag = True
+
+    async def _serve(self):
+        self._loop = asyncio.get_running_loop()
+        self._loop_thread = threading.get_ident()
+        self._stop_event = asyncio.Event()
+        if self.exit_flag:
+            return
 
+        server = await asyncio.start_server(self._handle_client, self.host, self.port, reuse_address=True)
         logger.info(f"TCP Server listening on {self.host}:{self.port}")
-        #print(f"TCP Server listening on {self.host}:{self.port}")
-
-        # warten auf Client
-        self._wait_for_client()
-
-        if not self.server_socket: return
 
-        # Server-Socket nicht mehr noetig
-        self.server_socket.close()
-        self.server_socket = None
+        async with server:
+            await self._stop_event.wait()
+            server.close()
+            for client in list(self.clients):
+                self._close(client)
+            await server.wait_closed()
 
-        # empfangen, bis exit oder FIN
-        self._listen()
 
-        # Nach Empfang -> alles schliessen
-        self.stop()
-
-    
     # ---------------------------------------------------------
-    # auf Verbindung warten (Endlosschleife)
+    # ein Client: empfangen, zeilenweise in seine Queue
     # ---------------------------------------------------------
-    def _wait_for_client(self):
-        if not self.server_socket or self.exit_flag:
-            return
-        
-        self.server_socket.settimeout(0.5)   # akzeptiere max 0.5s blockierend
-
-        while self.server_socket and not self.exit_flag:
-            try:
-                self.client_socket, self.client_address = self.server_socket.accept()
-                logger.info(f"TCP Connection from {self.client_address}")
-                break
-            except socket.timeout:
-                continue   # pruefe exit_flag, weiter warten
-            except OSError as e:
-                # falls socket von aussen closed wurde -> abbrechen
-                logger.info(f"accept() aborted: {e}")
-                break
-
-    # ---------------------------------------------------------
-    # Empfangen (Endlosschleife)
-    # ---------------------------------------------------------
-    def _listen(self):
-        if not self.client_socket or self.exit_flag:
-            return
-        
-        self.client_socket.settimeout(0.5)
-
-        while self.client_socket and not self.exit_flag:
-            try:
-                data = self.client_socket.recv(1024)
+    async def _handle_client(self, reader, writer):
+        client = TcpClient(reader, writer)
+        self.clients.add(client)
+        logger.info(f"TCP Connection from {client.address}, {len(self.clients)} clients")
+        worker = asyncio.create_task(self._serve_client(client))
+        buffer = b""
+        try:
+            while not (self.exit_flag or client.closing):
+                try:
+                    timeout = UNTERMINATED_TIMEOUT if buffer else None
+                    data = await asyncio.wait_for(reader.read(1024), timeout)
+                except asyncio.TimeoutError:
+                    # no line end coming, take what we have
+                    data = b"\n"
 
                 if not data:
-                    logger.info("TCP Connection ended (FIN)")
+                    logger.info(f"TCP Connection ended (FIN) {client.address}")
                     break
 
                 if self.verbose:
                     logger.info(f"TCP recd: {utils.bbbstr(data)}")
 
-                msg = (
-                    data.decode("utf-8")
-                    .strip()
-                    .replace("\0", "")
-                    .replace("\r", "")
-                    .replace("\n", "")
-                    .replace('"', "")
-                    .replace("'", "")
-                )
-
-                if msg:
-                    if self.verbose:
-                        logger.info(f"TCP recd: {msg}")
-
-                    m = msg.lower()
-
-                    if(self.command_callback) and self.command_callback(m,2):
-                        if self.verbose:
-                            logger.info("command_callback performed")
-                        pass
-                    else:
-                        self.received_data = msg
-
-            except socket.timeout:
-                # keine Daten → einfach exit_flag erneut pruefen
-                continue
-
-            except ConnectionError:
-                logger.warning("TCP Connection lost")
-                break
+                buffer += data
+                *lines, buffer = buffer.split(b"\n")
+                for line in lines:
+                    msg = (
+                        line.decode("utf-8", errors="replace")
+                        .strip()
+                        .replace("\0", "")
+                        .replace("\r", "")
+                        .replace('"', "")
+                        .replace("'", "")
+                    )
+                    if msg:
+                        await client.queue.put(msg)
+
+        except ConnectionError:
+            logger.warning(f"TCP Connection lost {client.address}")
+        except Exception:
+            logger.exception("_handle_client")
+        finally:
+            worker.cancel()
+            self._close(client)
+            self.clients.discard(client)
+
+    # ---------------------------------------------------------
+    # Anfragen eines Clients der Reihe nach abarbeiten
+    # ---------------------------------------------------------
+    async def _serve_client(self, client:TcpClient):
+        while True:
+            msg = await client.queue.get()
+            if self.verbose:
+                logger.info(f"TCP recd: {msg}")
 
+            try:
+                # in a worker thread, a slow command must not block the other clients
+                handled = bool(self.command_callback) and await self._loop.run_in_executor(None, self._run_command, client, msg)     # type: ignore
+            except asyncio.CancelledError:
+                raise
             except Exception:
-                logger.exception("_listen")
-                break
+                logger.exception("command_callback")
+                handled = True
+            if handled:
+                if self.verbose:
+                    logger.info("command_callback performed")
+            elif self.request_callback:
+                try:
+                    result = await asyncio.wrap_future(self.request_callback(msg))
+                    resp = result[-1]
+                except asyncio.CancelledError:
+                    raise
+                except Exception as e:
+                    resp = f"Error: {e}"
+                self._write(client, resp)
+            # next request only when the responses went out, a slow reader slows down its own requests
+            await self._drain(client)
+
+    async def _drain(self, client:TcpClient):
+        if client.closing:
+            return
+        try:
+            await client.writer.drain()
+        except ConnectionError:
+            self._close(client)
+
+    def _run_command(self, client:TcpClient, msg:str):
+        self._current.client = client
+        try:
+            return self.command_callback(msg.lower(), 2)     # type: ignore
+        finally:
+            self._current.client = None
 
     # ---------------------------------------------------------
-    # Sendet Antwort an den Client
+    # Sendet Antwort, aus command_callback an den anfragenden Client
     # ---------------------------------------------------------
-    def send(self, data):
+    def send(self, data, client:TcpClient=None):     # type: ignore
+        client = client or getattr(self._current, "client", None)
+        if client is None:
+            logger.warning(f"TCP send without client, data: {repr(str(data))}")
+            return
+        loop = self._loop
+        if loop is None:
+            return
+        if threading.get_ident() == self._loop_thread:
+            self._write(client, data)
+            return
+        try:
+            loop.call_soon_threadsafe(self._write, client, data)
+        except RuntimeError:
+            pass  # loop closed meanwhile
+
+    def _write(self, client:TcpClient, data):
+        if client.closing:
+            return
         if isinstance(data, str):
             if self.verbose:
                 logger.info(f"TCP send: {data}")
             data = data.encode("utf-8") + b"\n"
-
         try:
-            self.client_socket.send(data)
+            client.writer.write(data)
             if self.verbose:
                 logger.info(f"TCP sent: {utils.bbbstr(data)}")
         except Exception as e:
             logger.warning(f"TCP send failed: {e}, data: {repr(str(data))}")
+            return
+        # send() from callbacks does not wait for drain
+        if client.writer.transport.get_write_buffer_size() > CLIENT_WRITE_HIGH_WATER:
+            logger.warning(f"TCP client {client.address} not reading, closing it")
+            self._close(client)
 
     # ---------------------------------------------------------
-    # Holt gespeicherte Nachricht
+    # Schliesst die Verbindung des anfragenden Clients
     # ---------------------------------------------------------
-    def get_request(self) -> str:
-        msg = self.received_data
-        self.received_data = ""
-        return msg
+    def close_client(self):
+        client = getattr(self._current, "client", None)
+        if(client is None) or (self._loop is None):
+            return
+        try:
+            self._loop.call_soon_threadsafe(self._close, client)
+        except RuntimeError:
+            pass  # loop closed meanwhile
+
+    def _close(self, client:TcpClient):
+        if client.closing:
+            return
+        client.closing = True
+        try:
+            client.writer.close()
+        except:
+            pass
 
     # ---------------------------------------------------------
     # Schliesst alles
     # ---------------------------------------------------------
     def stop(self):
-        if self.exit_flag: 
+        if self.exit_flag:
             return
 
         logger.info("closing TCP Server")
@@ -168,68 +242,83 @@ class TcpServer:
         self.exit_flag = True
 
         try:
-            if self.client_socket:
-                self.client_socket.close()
-        except:
-            pass
-        self.client_socket = None
-
-        try:
-            if self.server_socket:
-                self.server_socket.close()
-        except:
-            pass
-        self.server_socket = None
+            if self._loop is not None:
+                self._loop.call_soon_threadsafe(self._stop_event.set)     # type: ignore
+        except RuntimeError:
+            pass  # loop closed meanwhile
 
 
 
 # ------------------------
-# main for test only
+# main for test only - load test, 50 clients with pipelined requests,
+# bus simulated by one worker thread with 2 ms per request
 # ------------------------
-import threading
-import time
-
 def main():
-    print("Starte TCP-Server-Endlosschleife. STRG+C zum Beenden.")
-
-    server = None  # global fuer Cleanup
+    import queue
+    import socket
+    from concurrent.futures import Future
 
-    def tcp_loop():
+    NUM_CLIENTS = 50
+    NUM_REQUESTS = 20
+    PORT = 9000
 
+    busq = queue.Queue()
+    def bus_worker():
         while True:
-            server = TcpServer("0.0.0.0", 9000, verbose=True)
-
-            # # Server in Thread starten
-            # t = threading.Thread(target=server.start, daemon=True)
-            # t.start()
-
-            # # # Warten bis der Thread fertig ist, aber STRG+C abfangen
-            # # while t.is_alive():
-            # #     t.join(timeout=0.5)  # kurz timeout, damit KeyboardInterrupt reagiert
-            # t.join()
-            server.run()
-
-            print("TCP-Session beendet. Warte 1 Sekunde, dann starte ich neu...\n")
-            time.sleep(1)
+            fut, msg = busq.get()
+            time.sleep(0.002)
+            fut.set_result((1, b"", 0, f"resp {msg}"))
+    threading.Thread(target=bus_worker, daemon=True).start()
+
+    def submit(msg):
+        fut = Future()
+        busq.put((fut, msg))
+        return fut
+
+    server = TcpServer("127.0.0.1", PORT)
+    server.request_callback = submit
+    threading.Thread(target=server.run, daemon=True).start()
+    time.sleep(0.5)
+
+    latencies = []
+    errors = []
+    def client(num):
+        try:
+            sock = socket.create_connection(("127.0.0.1", PORT))
+            sock.settimeout(30)
+            reqs = [f"read;0x{num:04x};2;{i}" for i in range(NUM_REQUESTS)]
+            t0 = time.monotonic()
+            # all at once, pipelined
+            sock.sendall("".join(r + "\n" for r in reqs).encode())
+            buf = b""
+            while buf.count(b"\n") < NUM_REQUESTS:
+                data = sock.recv(4096)
+                if not data:
+                    break
+                buf += data
+            latencies.append(time.monotonic() - t0)
+            resps = buf.decode().splitlines()
+            if resps != [f"resp {r}" for r in reqs]:
+                errors.append(f"client {num}: responses missing or out of order")
+            sock.close()
+        except Exception as e:
+            errors.append(f"client {num}: {e}")
 
-    try:
-        t = threading.Thread(target=tcp_loop, daemon=True)
+    t0 = time.monotonic()
+    threads = [threading.Thread(target=client, args=(n,)) for n in range(NUM_CLIENTS)]
+    for t in threads:
         t.start()
+    for t in threads:
         t.join()
-
-    except KeyboardInterrupt:
-        print("\nSTRG+C erkannt. Beende alles...")
-
-        if server:
-            server.stop()
-
-        # Optional: warte kurz, damit Threads sauber schliessen
-        time.sleep(0.5)
-
-        print("Programm beendet.")
-    
-    finally:
-        print("exit script")
+    elapsed = time.monotonic() - t0
+    server.stop()
+
+    latencies.sort()
+    total = NUM_CLIENTS * NUM_REQUESTS
+    print(f"{NUM_CLIENTS} clients x {NUM_REQUESTS} requests: {elapsed:.2f}s, {total / elapsed:.0f} req/s (bus limit {1 / 0.002:.0f})")
+    if latencies:
+        print(f"client done after: min {latencies[0]:.2f}s, median {latencies[len(latencies) // 2]:.2f}s, max {latencies[-1]:.2f}s")
+    print(f"errors: {len(errors)}", errors[:3])
 
 
 
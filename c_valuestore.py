@@ -0,0 +1,62 @@
+'''
+   Copyright 2026 philippoo66
+
+   Licensed under the GNU GENERAL PUBLIC LICENSE, Version 3 (the "License");
+   you may not use this file except in compliance with the License.
+   You may obtain a copy of the License at
+
+       https://www.gnu.org/licenses/gpl-3.0.html
+
+   Unless required by applicable law or agreed to in writing, software
+   distributed under the License is distributed on an "AS IS" BASIS,
+   WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+   See the License for the specific language governing permissions and
+   limitations under the License.
+'''
+
+# ---------------------------------------------------------------
+# Latest decoded value of every poll item with the time it was
+# read, for consumers not using MQTT (HTTP API). Each change bumps
+# a version number, usable as ETag. The same value read again is no
+# change (time stays the one of the change), so clients asking with
+# If-None-Match get 304 as long as nothing changed.
+# ---------------------------------------------------------------
+
+import threading
+import time
+
+
+class cValueStore:
+    def __init__(self):
+        self._values = {}   # name -> (value, DpAddr, epoch time, version)
+        self._lock = threading.Lock()
+        self.version = 0
+
+
+    def set(self, name:str, addr, value) -> bool:
+        """ True if changed """
+        with self._lock:
+            entry = self._values.get(name)
+            if(entry is not None) and (entry[0] == value) and (entry[1] == addr):
+                return False
+            self.version += 1
+            self._values[name] = (value, addr, time.time(), self.version)
+            return True
+
+    def get(self, name:str):
+        """ (value, DpAddr, epoch time, version) or None """
+        return self._values.get(name)
+
+    def snapshot(self) -> tuple:  # (version, {name: (value, DpAddr, epoch time, version)})
+        with self._lock:
+            return self.version, dict(self._values)
+
+    def clear(self):
+        with self._lock:
+            if self._values:
+                self.version += 1
+                self._values.clear()
+
+
+# === for global use ================
+values = cValueStore()
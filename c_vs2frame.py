@@ -0,0 +1,347 @@
+'''
+   Copyright 2026 philippoo66
+
+   Licensed under the GNU GENERAL PUBLIC LICENSE, Version 3 (the "License");
+   you may not use this file except in compliance with the License.
+   You may obtain a copy of the License at
+
+       https://www.gnu.org/licenses/gpl-3.0.html
+
+   Unless required by applicable law or agreed to in writing, software
+   distributed under the License is distributed on an "AS IS" BASIS,
+   WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+   See the License for the specific language governing permissions and
+   limitations under the License.
+'''
+
+# ---------------------------------------------------------------
+# Incremental VS2 telegram parser. Gets fed the received chunks
+# and tells when a telegram is complete - no re-slicing of the
+# receive buffer per byte, no second copy of all received data.
+# Used by optolinkvs2.receive_telegr for the Optolink side as well
+# as for the Vitoconnect listener.
+# Hot path without buffer allocations: chunks go into the
+# preallocated buffer through the cached memoryview, the views of
+# checksum range and payload are created once per telegram length
+# and reused, header fields are read from the buffer on demand.
+# Left per telegram: the int of the checksum. Only the data handed
+# out (payload(), alldata()) gets copied.
+# ---------------------------------------------------------------
+
+from zlib import adler32
+
+
+def _sum8(view) -> int:
+    # modulo-256 sum of the bytes in C without iterating them in Python: the low
+    # word of adler32 is 1 + sum of the bytes (no wrap up to 257 bytes)
+    return (adler32(view) - 1) & 0xFF
+
+
+class cVS2FrameParser:
+    # ACK + STX + Len + max payload + CRC
+    MAX_FRAME = 1 + 1 + 1 + 255 + 1
+
+    __slots__ = ('buff', 'view', 'capacity', 'resptelegr', 'pos', 'need', 'start', 'end', 'retcode', 'errbyte', '_views', '_frame_views')
+
+    def __init__(self, resptelegr:bool=True, capacity:int=MAX_FRAME):
+        """
+        resptelegr: True = response telegram with leading ACK/NACK expected (Optolink side),
+                    False = master request telegram without (Vitoconnect side)
+        """
+        self.buff = bytearray(capacity)
+        self.view = memoryview(self.buff)
+        self.capacity = capacity
+        self.resptelegr = resptelegr
+        # (checksum range view, payload view) by [STX index][end index], created when first needed
+        self._frame_views = ([None] * (capacity + 1), [None] * (capacity + 1))
+        self._views = None      # views of the complete telegram, valid if end
+        self.start = 0          # index of STX
+        self.errbyte = 0        # offending byte in case of error
+        self.reset()
+
+
+    def reset(self, resptelegr=None):
+        """ drop everything received so far """
+        if resptelegr is not None:
+            self.resptelegr = resptelegr
+        self.pos = 0            # number of bytes in buffer
+        # as _clear_frame, inline (once per telegram)
+        self.need = 1
+        self.end = 0
+        self.retcode = None
+
+
+    def _clear_frame(self):
+        self.need = 1           # bytes in buffer required for the next evaluation step
+        self.end = 0            # index behind CRC when complete
+        self.retcode = None     # set when telegram complete or error
+
+
+    def next_frame(self, resptelegr=None):
+        """
+        prepare for the next telegram. bytes received behind a complete telegram are kept,
+        after an error or timeout everything gets dropped.
+        """
+        if resptelegr is not None:
+            self.resptelegr = resptelegr
+        if self.retcode in (0x01, 0x03) and (self.end < self.pos):
+            rest = self.pos - self.end
+            # rare case, small temp copy is fine here
+            self.buff[0:rest] = bytes(self.view[self.end:self.pos])
+            self.pos = rest
+            self._clear_frame()
+        else:
+            self.reset()
+
+
+    def feed(self, chunk) -> int:   # retcode or None if more bytes needed
+        pos = self.pos
+        end = pos + len(chunk)
+        try:
+            # same size assignment through the view, nothing allocated
+            self.view[pos:end] = chunk
+        except ValueError:
+            # longest possible telegram exceeded, whatever comes more is trash
+            end = self.capacity
+            self.view[pos:end] = chunk[:end - pos]
+        self.pos = end
+        need = self.need
+        if end < need:
+            return None
+
+        # evaluate, inline (one call per chunk only)
+        # ReturnCode: 01=success, 03=ErrMsg, 15=NACK, 20=UnknB0_Err, 41=STX_Err, FD=PlLen_Err, FE=CRC_Err (all hex)
+        if self.retcode is not None:
+            return self.retcode
+        buff = self.buff
+        pos = end
+        end = need
+        if end >= 8:
+            # header evaluated already, end of telegram known
+            if pos < end:
+                return None
+            start = self.start
+        else:
+            start = 0
+            if self.resptelegr:
+                if pos < 1:
+                    self.need = 1
+                    return None
+                b0 = buff[0]
+                if b0 == 0x06:  # VS2_ACK
+                    start = 1
+                elif b0 == 0x15:  # VS2_NACK
+                    return self._set_error(0x15, b0)
+                else:
+                    return self._set_error(0x20, b0)
+            self.start = start
+
+            # ab hier Master Request und Slave Response identischer Aufbau
+            if(pos > start) and (buff[start] != 0x41):  # STX
+                return self._set_error(0x41, buff[start])
+            if pos <= start + 1:
+                # STX and Len in one step
+                self.need = start + 2
+                return None
+            pllen = buff[start + 1]
+            if pllen < 5:  # protocol_Id + MsgId|FnctCode + AddrHi + AddrLo + BlkLen
+                return self._set_error(0xFD, pllen)
+            end = start + pllen + 3  # STX + Len + Payload + CRC, at least 8
+            if pos < end:
+                self.need = end
+                return None
+
+        # receive complete
+        self.need = 0
+        self.end = end
+        views = self._frame_views[start][end]
+        if views is None:
+            views = self._frame_views[start][end] = (self.view[start + 1:end - 1], self.view[start + 7:end - 1])
+        self._views = views
+        if buff[end - 1] != _sum8(views[0]):
+            self.errbyte = buff[end - 1]
+            self.retcode = 0xFE
+        elif (buff[start + 2] & 0x0F) == 0x03:  # msgid Error Message
+            self.retcode = 0x03
+        else:
+            self.retcode = 0x01
+        return self.retcode
+
+    def evaluate(self) -> int:   # retcode or None if more bytes needed
+        """ evaluate what is in the buffer already (e.g. kept by next_frame) """
+        return self.feed(b'')
+
+
+    def _set_error(self, retcode:int, errbyte:int) -> int:
+        self.need = 0
+        self.retcode = retcode
+        self.errbyte = errbyte
+        return retcode
+
+
+    @property
+    def crc(self) -> int:
+        """ calculated CRC of the complete telegram """
+        return _sum8(self._views[0]) if self.end else 0
+
+    # header fields of the complete telegram, defaults before
+    @property
+    def msgid(self) -> int:
+        """ message type identifier, byte 2 (0 = Request, 1 = Response, 2 = UNACKD, 3 = Error Message) """
+        return self.buff[self.start + 2] if self.end else 0x100
+
+    @property
+    def msqn(self) -> int:
+        """ message sequence number, top 3 bits of byte 3 """
+        return (self.buff[self.start + 3] & 0xE0) >> 5 if self.end else 0x100
+
+    @property
+    def fctcd(self) -> int:
+        """ function code, low 5 bits of byte 3 """
+        return self.buff[self.start + 3] & 0x1F if self.end else 0x100
+
+    @property
+    def addr(self) -> int:
+        """ may be bullshit in case of raw """
+        return (self.buff[self.start + 4] << 8) + self.buff[self.start + 5] if self.end else 0
+
+    @property
+    def dlen(self) -> int:
+        return self.buff[self.start + 6] if self.end else -1
+
+    @property
+    def payload_view(self) -> memoryview:
+        """ data bytes of the complete telegram, no copy, valid until the next telegram """
+        if self.end == 0:
+            return self.view[0:0]
+        return self._views[1]
+
+    @property
+    def frame_view(self) -> memoryview:
+        """ STX up to CRC of the complete telegram, no copy """
+        return self.view[self.start:self.end]
+
+    @property
+    def all_view(self) -> memoryview:
+        """ everything received for the current telegram (incl. ACK), no copy """
+        return self.view[0:(self.end or self.pos)]
+
+    def payload(self) -> bytearray:
+        """ copy of the data bytes, e.g. to be handed out to callers """
+        if self.end == 0:
+            return bytearray()
+        return bytearray(self._views[1])
+
+    def alldata(self) -> bytearray:
+        """ copy of everything received for the current telegram (incl. ACK) """
+        return self.buff[0:(self.end or self.pos)]
+
+
+
+# ------------------------
+# main for test only - microbenchmark against the former slicing receive
+# ------------------------
+def _legacy_crc(telegram) -> int:
+    # as optolinkvs2.calc_crc
+    return sum(telegram[1:telegram[1] + 2]) % 0x100
+
+def _legacy_parse(chunks, resptelegr=True) -> tuple:
+    # state machine as formerly in optolinkvs2.receive_telegr (logging and callbacks left out)
+    state = 0
+    inbuff = bytearray()
+    alldata = bytearray()
+    for inbytes in chunks:
+        inbuff += inbytes
+        alldata += inbytes
+        if state == 0:
+            if resptelegr:
+                if len(inbuff) > 0:
+                    if inbuff[0] != 0x06:
+                        return 0x15, alldata
+                    state = 1
+                    inbuff = inbuff[1:]
+            else:
+                state = 1
+        if state == 1:
+            if len(inbuff) > 0:
+                if inbuff[0] != 0x41:
+                    return 0x41, alldata
+                state = 2
+        if state == 2:
+            if len(inbuff) > 1:
+                pllen = inbuff[1]
+                if len(inbuff) >= pllen + 3:
+                    inbuff = inbuff[:pllen + 4]
+                    msgid = inbuff[2]
+                    msqn = (inbuff[3] & 0xE0) >> 5
+                    fctcd = inbuff[3] & 0x1F
+                    addr = (inbuff[4] << 8) + inbuff[5]
+                    dlen = inbuff[6]
+                    retdata = inbuff[7:pllen + 2]
+                    crc = _legacy_crc(inbuff)
+                    if inbuff[-1] != crc:
+                        return 0xFE, addr, retdata, msgid, msqn, fctcd, dlen
+                    return 0x01, addr, retdata, msgid, msqn, fctcd, dlen
+    return 0xFF, 0, alldata
+
+
+def main():
+    import time
+    import tracemalloc
+
+    rounds = 20000
+    parser = cVS2FrameParser()
+
+    # typical responses received byte by byte (as with 4800 baud and event driven receive) and at once
+    for dlen, bytewise in ((2, True), (8, True), (40, True), (8, False), (40, False)):
+        data = bytes(range(dlen))
+        frame = bytearray([0x41, 5 + dlen, 0x01, 0x01, 0x00, 0xF8, dlen]) + data
+        frame.append(sum(frame[1:]) % 0x100)
+        frame = bytes([0x06]) + bytes(frame)
+        chunks = [frame[i:i + 1] for i in range(len(frame))] if bytewise else [frame]
+
+        def legacy_once():
+            _legacy_parse(chunks)
+
+        def parser_once():
+            # parsing only, payload as view
+            parser.reset()
+            for chunk in chunks:
+                if parser.feed(chunk) is not None:
+                    break
+            parser.addr
+            parser.payload_view
+
+        def parser_copy_once():
+            # as receive_telegr, payload copy handed out
+            parser_once()
+            parser.payload()
+
+        def harness_once():
+            # loop of the measurement itself, subtracted
+            for chunk in chunks:
+                if chunk is None:
+                    break
+
+        parser_once()   # views of this telegram length created once
+        print(f"--- {dlen} data bytes, {len(chunks)} chunk(s)")
+        for name, func in (("legacy slicing", legacy_once), ("cVS2FrameParser", parser_once), ("  + payload()", parser_copy_once), ("(harness)", harness_once)):
+            t0 = time.perf_counter()
+            for _ in range(rounds):
+                func()
+            dt = time.perf_counter() - t0
+            # temporary memory high-water mark per telegram
+            tracemalloc.start()
+            total = 0
+            for _ in range(1000):
+                base, _ = tracemalloc.get_traced_memory()
+                tracemalloc.reset_peak()
+                func()
+                _, peak = tracemalloc.get_traced_memory()
+                total += peak - base
+            tracemalloc.stop()
+            print(f"{name:16s}: {dt / rounds * 1e6:6.2f} us/telegram, peak {total / 1000:6.1f} temp bytes/telegram")
+
+
+if __name__ == "__main__":
+    main()
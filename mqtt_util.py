@@ -15,20 +15,27 @@
 '''
 
 import time
-import threading
+import json
 import paho.mqtt.client as paho
 
 from c_settings_adapter import settings
 from logger_util import logger
 from c_polllist import poll_list
+from c_busarbiter import bus
+from c_metrics import metrics
+from c_taskscheduler import task_scheduler
 import utils
 
 
 
 verbose = False
 
+cnt_published = metrics.counter("mqtt_published_total", "MQTT messages published")
+cnt_suppressed = metrics.counter("mqtt_suppressed_total", "MQTT messages not published because unchanged (mqtt_no_redundant)")
+metrics.gauge("mqtt_queue_depth", "MQTT commands waiting for the Optolink bus", lambda: bus.pending("MQTT"))
+cnt_sets_merged = metrics.counter("mqtt_set_merged_total", "/set values superseded by a newer one of the same datapoint within set_debounce")
+
 mqtt_client = None
-cmnd_queue = []   # command queue to serialize bus traffic
 publ_queue = []   # stuff to get published
 
 recent_posts = {}
@@ -69,11 +76,15 @@ def on_message(client, userdata, msg):
         handle_set_topic(topic, msg.payload)
     elif topic == settings.mqtt_listen:
         rec = utils.bstr2str(msg.payload)
+        if rec.lstrip().startswith('['):
+            # JSON array of datapoints to read, see requests_util.parse_readmulti_json
+            submit_request(rec.strip())
+            return
         rec = rec.replace(' ','').replace('\0','').replace('\n','').replace('\r','').replace('"','').replace("'","")
         if(command_callback) and command_callback(rec):
             pass
         else:
-            cmnd_queue.append(rec) 
+            submit_request(rec)
     else:
         # Ausgabe anderer eingehenden MQTT-Nachrichten
         logger.warning(f"MQTT recd: Topic = {msg.topic}, Payload = {msg.payload}")
@@ -142,6 +153,8 @@ def connect_mqtt():
     mlst = settings.mqtt_broker.split(':')      # type: ignore
     mqtt_client.connect(mlst[0], int(mlst[1]))
     mqtt_client.reconnect_delay_set(min_delay=1, max_delay=30)
+    # bounded command queue, see c_busarbiter
+    bus.set_limit("MQTT", settings.mqtt_queue_size, settings.mqtt_queue_policy)
     mqtt_client.loop_start()
     # preparations
     if(settings.mqtt_fstr is None):
@@ -150,41 +163,73 @@ def connect_mqtt():
     #    raise Exception("Error connecting MQTT: " + str(e))
 
 
-def get_mqtt_request() -> str:
-    if cmnd_queue:
-        return cmnd_queue.pop(0)
-    return ""
+def submit_request(cmnd:str):
+    # bus traffic gets serialized by the bus arbiter, response published when done
+    bus.submit(cmnd, source="MQTT").add_done_callback(on_request_done)
+
+def on_request_done(future):
+    if future.cancelled():
+        return
+    try:
+        _, _, _, resp = future.result()
+        publish_response(resp)
+    except Exception as e:
+        publish_response(f"Error: {e}")
 
 
-def publish_read(name, addr, value):
+def publish_read(name, addr, value, force=False):
     if mqtt_client:
+        if(settings.mqtt_publish_mode != 'topics'):
+            # collected for the JSON of the poll cycle
+            if force or (json_published.get(name, _sentinel) != value):
+                json_collected[name] = value
+            if(settings.mqtt_publish_mode == 'json'):
+                return
         publishStr = settings.mqtt_fstr.format(dpaddr = addr, dpname = name)
         # send
-        ret = publish_smart(settings.mqtt_topic + "/" + publishStr, value, retain=settings.mqtt_retain)    
+        ret = publish_smart(settings.mqtt_topic + "/" + publishStr, value, retain=settings.mqtt_retain, force=force)    
         if(verbose): print(ret)
 
 
+# mqtt_publish_mode 'json'/'both': name -> value changed since the last JSON, name -> value published last
+json_collected = {}
+json_published = {}
+
+def publish_collected():
+    """ one JSON of the values changed, at the end of a poll cycle (main loop only) """
+    global json_collected
+    if mqtt_client and json_collected:
+        msg = json.dumps({"time" : round(time.time(), 3), "values" : json_collected}, default=str)
+        json_published.update(json_collected)
+        json_collected = {}
+        publish_smart(settings.mqtt_topic + "/state", msg, retain=settings.mqtt_retain, force=True)
+
+
 def publish_response(resp:str):
     if mqtt_client:
         # always publish responses
+        cnt_published.inc()
         ret = mqtt_client.publish(settings.mqtt_respond, resp)    
         if(verbose): print(ret)
 
 
-def publish_smart(topic, value, qos=0, retain=False):
+def publish_smart(topic, value, qos=0, retain=False, force=False):
     if mqtt_client:
         if(settings.mqtt_no_redundant):
             # Publish only if the value changed
-            last = recent_posts.get(topic, _sentinel)
-            if last == value:
+            if(not force) and (recent_posts.get(topic, _sentinel) == value):
+                cnt_suppressed.inc()
                 return
+            # forced ones too, the same value next time is redundant
             recent_posts[topic] = value
+        cnt_published.inc()
         ret = mqtt_client.publish(topic, value, qos=qos, retain=retain)
         if(verbose): print(ret)
 
 
 def reset_recent_list():
     recent_posts.clear()
+    json_published.clear()
 
 
 
@@ -207,6 +252,7 @@ def exit_mqtt():
 
 
 # list of indexes of poll_list items to get refreshed immediately after got written
+# (only touched by the main loop, filled by tasks of the task scheduler)
 lst_force_refresh = []
 
 
@@ -218,13 +264,27 @@ def is_forced():
 
 def force_delayed(listidx, delay=1):
     # im Zweifesfalle koennen 4-5 Comm cycles dazwischen liegen
-    def worker():
-        time.sleep(delay)
-        lst_force_refresh.append(listidx)
+    # another write meanwhile -> still one read back, delay from the latest
+    def force():
+        if listidx not in lst_force_refresh:
+            lst_force_refresh.append(listidx)
+    task_scheduler.call_later(delay, force, key=("readback", listidx))
+
+
+def submit_set(addr, write_cmd, list_index):
+    # /set bursts (slider), last writer wins: written once no further /set 
+    # of the datapoint came in for set_debounce seconds
+    if(settings.set_debounce <= 0):
+        submit_write(write_cmd, list_index)
+        return
+    if task_scheduler.call_later(settings.set_debounce, lambda: submit_write(write_cmd, list_index), key=("set", addr)):
+        # waiting one replaced
+        cnt_sets_merged.inc()
 
-    t = threading.Thread(target=worker, daemon=True)
-    t.start()
-    return t  # optional
+def submit_write(write_cmd, list_index):
+    submit_request(write_cmd)
+    # Ensure the affected datapoint will be refreshed quite soon
+    force_delayed(list_index, settings.readback_delay_set)
 
 
 def handle_set_topic(topic, payload):
@@ -277,10 +337,7 @@ def handle_set_topic(topic, payload):
             write_cmd = f"write;{addr:#x};{length};{int_value}"
         
         logger.debug(f"Generated write command: {write_cmd}")
-        cmnd_queue.append(write_cmd)
-
-        # Ensure the affected datapoint will be refreshed quite soon
-        force_delayed(list_index, settings.readback_delay_set)
+        submit_set(addr, write_cmd, list_index)
 
     except: #Exception as e:
         logger.exception(f"handle_set_topic {topic}, {payload}")
@@ -290,7 +347,7 @@ def handle_set_topic(topic, payload):
 def convert_value_to_bytes(value_str, length, scale_type, signed):  # tuple of bytes, bool <- writeraw if True
     """
     Convert human-readable value string to bytes for writing.
-    Reverse operation of requests_util.get_value()
+    Reverse operation of c_decoder.cDecoder.decode()
     """
     try:
         # Handle different format types
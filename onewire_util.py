@@ -21,6 +21,20 @@ from c_settings_adapter import settings
 # Pfad zum One-Wire-Slave-Verzeichnis
 base_dir = '/sys/bus/w1/devices/'
 
+# called while waiting for a sensor - 1-wire does not use the Optolink bus,
+# so the bus owner may serve other requests (Vitoconnect) meanwhile
+idle_callback = None
+
+
+def w1_wait(secs:float):
+    if idle_callback is None:
+        time.sleep(secs)
+        return
+    end = time.monotonic() + secs
+    while (rest := end - time.monotonic()) > 0:
+        idle_callback()
+        time.sleep(min(rest, 0.01))
+
 
 def read_w1file(device_file):
     with open(device_file, 'r') as f:
@@ -49,7 +63,7 @@ def read_ds18b20(device_file) -> tuple[int, float]:  # retcode, temp_°C
                         print("Err_w1_temp_reasonabe", temp_c, lines)
         except:
             pass
-        time.sleep(0.2)
+        w1_wait(0.2)
     return 0xFF, -99.999  # FF = timeout
 
 
@@ -68,7 +82,7 @@ def read_ds2423(device_file) -> tuple[int, list[int]]:  # retcode, counts
                     return 0x01, counts
         except:
             pass
-        time.sleep(0.2)
+        w1_wait(0.2)
     return 0xFF, []  # FF = timeout
 
 
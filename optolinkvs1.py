@@ -20,6 +20,7 @@ import time
 
 from c_settings_adapter import settings
 from logger_util import logger
+from c_metrics import bus_meter
 import utils
 
 
@@ -141,6 +142,12 @@ def write_datapoint_ext(addr:int, data:bytes, ser:serial.Serial) -> tuple[int, i
 
 # mainly internal, receive a response @ known length
 def receive_resp_telegr(rlen:int, addr:int, ser:serial.Serial, ser2:serial.Serial=None) -> tuple[int, int, bytearray]:  # type: ignore
+    t_start = time.monotonic()
+    ret = _receive_resp_telegr(rlen, addr, ser, ser2)
+    bus_meter.telegram(ret[0], time.monotonic() - t_start)
+    return ret
+
+def _receive_resp_telegr(rlen:int, addr:int, ser:serial.Serial, ser2:serial.Serial=None) -> tuple[int, int, bytearray]:  # type: ignore
     # returns: ReturnCode, Addr, Data
     # ReturnCode: 01=success, AA=HandleLost, FF=TimeOut (all hex)
     # receives the V1 response to a Virtual_READ or Virtual_WRITE request @ known length
@@ -184,6 +191,28 @@ def receive_telegr(resptelegr:bool, raw:bool, ser:serial.Serial, ser2:serial.Ser
     return retcode, 0, data  # 0x01?!?
 
 
+def fullraw_end_detector(request):
+    """
+    end of response detection for a raw request telegram.
+    returns func(chunk) -> True when the response is complete, 
+    None if not predictable (end of telegram by silence only)
+    """
+    request = bytes(request)
+    if(request[:1] == b'\x01'):
+        # STX
+        request = request[1:]
+    if(len(request) == 4) and (request[0] in (0xF7, 0x6B, 0x7B)):
+        # Virtual_READ, GFA_Read, PROZESS_READ: response has the requested length
+        rlen = request[3]
+        received = 0
+        def resp_end(chunk) -> bool:
+            nonlocal received
+            received += len(chunk)
+            return (received >= rlen)
+        return resp_end
+    return None
+
+
 def receive_fullraw(eot_time, timeout, ser:serial.Serial, ser2:serial.Serial=None) -> tuple[int, bytearray]:        # type: ignore
     # times in seconds
     inbuff = b''
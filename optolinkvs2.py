@@ -15,11 +15,14 @@
 '''
 
 import serial
+import select
 import sys
 import time
 
 from c_settings_adapter import settings
 from logger_util import logger
+from c_vs2frame import cVS2FrameParser
+from c_metrics import bus_meter
 import utils
 
 
@@ -27,6 +30,36 @@ import utils
 # Optolink VS2 / 300 Protocol, mainly virtual r/w datapoints
 #++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++
 
+# VS2 response timeout 30x100ms
+RX_TIMEOUT = 3.0
+# fallback poll step if the port cannot be waited on (e.g. Windows, some url handlers)
+RX_POLL_STEP = 0.005
+
+# receive parser of the Optolink side (bus thread only)
+rx_parser = cVS2FrameParser(resptelegr=True)
+
+def wait_rx(ser:serial.Serial, timeout:float) -> bool:
+    """
+    Blocks until bytes are available at ser or timeout (seconds) elapsed.
+    Returns False on timeout. On ports without selectable file descriptor 
+    it sleeps RX_POLL_STEP (at most timeout) and returns True.
+    """
+    if(timeout <= 0):
+        return False
+    try:
+        fd = ser.fileno()
+    except Exception:
+        fd = None
+    if(fd is not None):
+        try:
+            readable, _, _ = select.select([fd], [], [], timeout)
+            return bool(readable)
+        except (OSError, ValueError):
+            pass
+    time.sleep(min(timeout, RX_POLL_STEP))
+    return True
+
+
 def init_vs2(ser:serial.Serial) -> bool:
 
     # after the serial port read buffer is emptied
@@ -147,7 +180,7 @@ def do_request(ser:serial.Serial, fctcode:int, addr:int, rlen:int, data:bytes=b'
     return receive_telegr(True, False, ser)
 
 
-def receive_telegr(resptelegr:bool, raw:bool, ser:serial.Serial, ser2:serial.Serial=None, mqtt_publ_callback=None) -> tuple[int, int, bytearray]:       # type: ignore
+def receive_telegr(resptelegr:bool, raw:bool, ser:serial.Serial, ser2:serial.Serial=None, mqtt_publ_callback=None, parser:cVS2FrameParser=None) -> tuple[int, int, bytearray]:       # type: ignore
     """
     Empfaengt ein VS2-Telegramm.
 
@@ -167,6 +200,9 @@ def receive_telegr(resptelegr:bool, raw:bool, ser:serial.Serial, ser2:serial.Ser
         Standardwert ist None.
     mqtt_publ_callback :
         Funktion zum Publizieren der (Vitoconnect) Daten auf MQTT
+    parser : cVS2FrameParser, optional
+        Eigener Parser, der Bytes hinter einem kompletten Telegramm fuer den naechsten Aufruf behaelt
+        (Vitoconnect Listener). Standardwert None = rx_parser, wird bei jedem Aufruf geleert.
 
     Rueckgabewerte:
     ---------------
@@ -195,138 +231,119 @@ def receive_telegr(resptelegr:bool, raw:bool, ser:serial.Serial, ser2:serial.Ser
     ----------
     Diese Funktion blockiert, bis das Telegramm vollstaendig empfangen oder ein Timeout erreicht wurde.
     """
+    t_start = time.monotonic()
+    ret = _receive_telegr(resptelegr, raw, ser, ser2, mqtt_publ_callback, parser)
+    if resptelegr:
+        # response to a request sent right before
+        bus_meter.telegram(ret[0], time.monotonic() - t_start)
+    return ret
+
+
+def _receive_telegr(resptelegr:bool, raw:bool, ser:serial.Serial, ser2:serial.Serial=None, mqtt_publ_callback=None, parser:cVS2FrameParser=None) -> tuple[int, int, bytearray]:       # type: ignore
     # returns: ReturnCode, Addr, Data
     # ReturnCode: 01=success, 03=ErrMsg, 15=NACK, 20=UnknB0_Err, 41=STX_Err, AA=HandleLost, FD=PlLen_Err, FE=CRC_Err, FF=TimeOut (all hex)
     # receives the V2 response to a Virtual_READ or Virtual_WRITE request
-    state = 0
-    inbuff = bytearray()
-    alldata = bytearray()
-    retdata = bytearray()
-    addr = 0
-    msgid = 0x100  # message type identifier, byte 2 (3. byte; 0 = Request Message, 1 = Response Message, 2 = UNACKD Message, 3 = Error Message) 
-    msqn = 0x100   # message sequence number, top 3 bits of byte 3
-    fctcd = 0x100  # function code, low 5 bis of byte 3 (https://github.com/sarnau/InsideViessmannVitosoft/blob/main/VitosoftCommunication.md#defined-commandsfunction-codes)
-    dlen = -1
-
-    # for up 30x100ms serial data is read. (we do 600x5ms)
-    for _ in range(600):
-        time.sleep(0.005)
+    if parser is None:
+        parser = rx_parser
+        parser.reset(resptelegr)
+    else:
+        # keep what was received behind the previous telegram
+        parser.next_frame(resptelegr)
+    retcode = parser.evaluate()
+
+    # for up 30x100ms serial data is read, woken up as soon as bytes arrive
+    deadline = time.monotonic() + RX_TIMEOUT
+    while retcode is None:
         try:
+            if not wait_rx(ser, deadline - time.monotonic()):
+                break
             inbytes = ser.read_all()
-            if(inbytes):
-                inbuff += inbytes
-                alldata += inbytes
         except:
             utils.comm_error(True)
-            return 0xAA, 0, retdata
+            return 0xAA, 0, bytearray()
 
-        # ggf. gleich durchleiten 
-        if(ser2 is not None):
-            if(inbytes):
+        if(inbytes):
+            # ggf. gleich durchleiten 
+            if(ser2 is not None):
                 ser2.write(inbytes)
-        
-        # evaluate
-        if(state == 0):
-            if(resptelegr):
-                if(len(inbuff) > 0):
-                    if(settings.show_opto_rx):
-                        print("rx", format(inbuff[0], settings.data_hex_format))
-                    if(inbuff[0] == 0x06): # VS2_ACK
-                        state = 1
-                    elif(inbuff[0] == 0x15): # VS2_NACK
-                        logger.error("VS2 NACK Error")
-                        retdata = alldata
-                        if(mqtt_publ_callback):
-                            mqtt_publ_callback(0x15, addr, retdata, msgid, msqn, fctcd, dlen)
-                        utils.comm_error(True)
-                        return 0x15, 0, retdata       # hier muesste ggf noch ein eventueller Rest des Telegrams abgewartet werden 
-                    else:
-                        logger.error(f"VS2 unknown first byte Error, {inbuff[0]:02X}")
-                        retdata = alldata
-                        if(mqtt_publ_callback):
-                            mqtt_publ_callback(0x20, addr, retdata, msgid, msqn, fctcd, dlen)
-                        utils.comm_error(True)
-                        return 0x20, 0, retdata
-                    # erstes Byte abtrennen
-                    inbuff = inbuff[1:]
-            else:
-                state = 1
-        
-        # ab hier Master Request und Slave Response identischer Aufbau (abgesehen von Error Message und sowas)
-        if(state == 1):
-            if(len(inbuff) > 0):
-                if(inbuff[0] != 0x41): # STX
-                    logger.error(f"VS2 STX Error, {inbuff[0]:02X}")
-                    retdata = alldata
-                    if(mqtt_publ_callback):
-                        mqtt_publ_callback(0x41, addr, retdata, msgid, msqn, fctcd, dlen)
-                    #if(raw): retdata = alldata
-                    utils.comm_error(True)
-                    return 0x41, 0, retdata  # hier muesste ggf noch ein eventueller Rest des Telegrams abgewartet werden
-                state = 2
-
-        if(state == 2):
-            if(len(inbuff) > 1):  # STX, Len
-                pllen = inbuff[1]
-                if(pllen < 5):  # protocol_Id + MsgId|FnctCode + AddrHi + AddrLo + BlkLen
-                    print("rx", utils.bbbstr(inbuff))
-                    logger.error(f"VS2 Len Error, {pllen}")
-                    retdata = alldata
-                    if(mqtt_publ_callback):
-                        mqtt_publ_callback(0xFD, addr, retdata, msgid, msqn, fctcd, dlen)
-                    #if(raw): retdata = alldata
-                    utils.comm_error(True)
-                    return 0xFD, 0, retdata  # alldata?!
-                if(len(inbuff) >= pllen + 3):  # STX + Len + Payload + CRC
-                    # receive complete
-                    if(settings.show_opto_rx):
-                        print("rx", utils.bbbstr(inbuff))
-                    inbuff = inbuff[:pllen+4]  # make sure no tailing trash 
-                    msgid = inbuff[2]
-                    msqn = (inbuff[3] & 0xE0) >> 5
-                    fctcd = inbuff[3] & 0x1F
-                    addr = (inbuff[4] << 8) + inbuff[5]  # may be bullshit in case of raw
-                    dlen = inbuff[6]
-                    retdata = inbuff[7:pllen+2]   # STX + Len + ProtId + MsgId|FnctCode + AddrHi + AddrLo + BlkLen (+ Data) + CRC
-                    crc = calc_crc(inbuff)
-                    if(inbuff[-1] != crc):
-                        logger.error(f"VS2 CRC Error, {inbuff[-1]:02X}/{crc:02X}")
-                        if(mqtt_publ_callback):
-                            mqtt_publ_callback(0xFE, addr, retdata, msgid, msqn, fctcd, dlen)
-                        if(raw): retdata = alldata
-                        utils.comm_error(True)
-                        return 0xFE, addr, retdata
-                    if(inbuff[2] & 0x0F == 0x03):
-                        #logger.info(f"Error Message {utils.bbbstr(retdata)} on 0x{addr:04x}")
-                        if(mqtt_publ_callback):
-                            mqtt_publ_callback(0x03, addr, retdata, msgid, msqn, fctcd, dlen)
-                        if(raw): retdata = alldata
-                        utils.comm_error(False)
-                        return 0x03, addr, retdata
-                    #success
-                    if(mqtt_publ_callback):
-                        mqtt_publ_callback(0x01, addr, retdata, msgid, msqn, fctcd, dlen)
-                    if(raw): retdata = alldata
-                    utils.comm_error(False)
-                    return 0x01, addr, retdata
-    # timout if get to here
+            retcode = parser.feed(inbytes)
+
+    if retcode is None:
+        # timout if get to here
+        if(settings.show_opto_rx):
+            logger.warning("rx telegr timeout")
+        retdata = parser.alldata() if raw else bytearray()
+        if(mqtt_publ_callback):
+            mqtt_publ_callback(0xFF, 0, retdata, parser.msgid, parser.msqn, parser.fctcd, parser.dlen)
+        utils.comm_error(True)
+        return 0xFF, 0, retdata
+
+    if(retcode in (0x15, 0x20, 0x41, 0xFD)):
+        # hier muesste ggf noch ein eventueller Rest des Telegrams abgewartet werden
+        if(retcode == 0x15):
+            logger.error("VS2 NACK Error")
+        elif(retcode == 0x20):
+            logger.error(f"VS2 unknown first byte Error, {parser.errbyte:02X}")
+        elif(retcode == 0x41):
+            logger.error(f"VS2 STX Error, {parser.errbyte:02X}")
+        else:
+            print("rx", utils.bbbstr(parser.all_view))
+            logger.error(f"VS2 Len Error, {parser.errbyte}")
+        retdata = parser.alldata()
+        if(mqtt_publ_callback):
+            mqtt_publ_callback(retcode, 0, retdata, parser.msgid, parser.msqn, parser.fctcd, parser.dlen)
+        utils.comm_error(True)
+        return retcode, 0, retdata
+
+    # receive complete
     if(settings.show_opto_rx):
-        logger.warning("rx telegr timeout")
+        print("rx", utils.bbbstr(parser.all_view))
+    addr = parser.addr
+    retdata = parser.payload()
+    if(retcode == 0xFE):
+        logger.error(f"VS2 CRC Error, {parser.errbyte:02X}/{parser.crc:02X}")
+    #elif(retcode == 0x03):
+    #    logger.info(f"Error Message {utils.bbbstr(retdata)} on 0x{addr:04x}")
     if(mqtt_publ_callback):
-        mqtt_publ_callback(0xFF, addr, retdata, msgid, msqn, fctcd, dlen)
-    if(raw): retdata = alldata
-    utils.comm_error(True)
-    return 0xFF, addr, retdata
+        mqtt_publ_callback(retcode, addr, retdata, parser.msgid, parser.msqn, parser.fctcd, parser.dlen)
+    if(raw): retdata = parser.alldata()
+    utils.comm_error(retcode == 0xFE)
+    return retcode, addr, retdata
 
 
-def receive_fullraw(eot_time, timeout, ser:serial.Serial, ser2:serial.Serial=None) -> tuple[int, bytearray]:        # type: ignore
+def fullraw_end_detector(request):
+    """
+    end of response detection for a raw request telegram.
+    returns func(chunk) -> True when the response is complete, 
+    None if not predictable (end of telegram by silence only)
+    """
+    request = bytes(request)
+    if(request == b'\x16\x00\x00'):
+        # protocol init, ACK expected
+        return lambda chunk: True
+    if(len(request) > 1) and (request[0] == 0x41):
+        # STX, response telegram expected (or NACK)
+        parser = cVS2FrameParser(resptelegr=True)
+        def frame_end(chunk) -> bool:
+            return parser.feed(chunk) in (0x01, 0x03, 0xFE, 0x15)
+        return frame_end
+    return None
+
+
+def receive_fullraw(eot_time, timeout, ser:serial.Serial, ser2:serial.Serial=None, frame_end=None) -> tuple[int, bytearray]:        # type: ignore
     # times in seconds
+    # frame_end: func(chunk) -> True if complete, see fullraw_end_detector
     inbuff = b''
     start_time = time.monotonic()
     last_receive_time = start_time
 
     while True:
-        time.sleep(0.005)
+        # wait for bytes, but not longer than eot or timeout
+        now = time.monotonic()
+        waittime = start_time + timeout - now
+        if inbuff:
+            waittime = min(waittime, last_receive_time + eot_time - now)
+        wait_rx(ser, waittime)
         # Zeichen vom Serial Port lesen
         inbytes = ser.read_all()
 
@@ -336,14 +353,20 @@ def receive_fullraw(eot_time, timeout, ser:serial.Serial, ser2:serial.Serial=Non
             last_receive_time = time.monotonic()
             if(ser2 is not None):
                 ser2.write(inbytes)
-        elif inbuff and (time.monotonic() > last_receive_time + eot_time):
+            if(frame_end is not None) and frame_end(inbytes):
+                # complete according to protocol, no need to wait eot_time
+                if(settings.show_opto_rx):
+                    print("rx", utils.bbbstr(inbuff))
+                utils.comm_error(False)
+                return 0x01, bytearray(inbuff)
+        elif inbuff and (time.monotonic() >= last_receive_time + eot_time):
             # if data received and no further receive since more than eot_time
             if(settings.show_opto_rx):
                 print("rx", utils.bbbstr(inbuff))
             utils.comm_error(False)
             return 0x01, bytearray(inbuff)
 
-        if(time.monotonic() > start_time + timeout):
+        if(time.monotonic() >= start_time + timeout):
             if(settings.show_opto_rx):
                 print("rx fullraw timeout", utils.bbbstr(inbuff))
             utils.comm_error(True)
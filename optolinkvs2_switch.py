@@ -29,9 +29,19 @@ import vs12_adapter
 import viconn_util
 import viessdata_util
 import c_tcpserver
+import c_httpserver
 import requests_util
 from c_logging import viconnlog
 from c_polllist import poll_list
+from c_pollscheduler import poll_scheduler
+from c_busarbiter import bus
+from c_dpcache import dp_cache
+from c_metrics import metrics, bus_meter
+from c_valuestore import values
+from c_dpstats import dp_stats
+from c_pollbreaker import poll_breaker
+from c_taskscheduler import task_scheduler
+import onewire_util
 import utils
 import wo1c_energy
 import c_LoggingSerial
@@ -39,9 +49,13 @@ import c_LoggingSerial
 # exit flag e.g. to stop endless loops
 progr_exit_flag = False
 
+# max seconds the idle main loop sleeps without wakeup (safety net only)
+IDLE_TIMEOUT = 1.0
+
 # ether objects
 mod_mqtt = None
 tcp_server = None
+http_server = None
 
 splitter_started = time.time()
 last_vs1_comm = 0
@@ -51,102 +65,111 @@ reload_poll_flag = False
 
 num_vicon_tries = 0
 num_restarts = 0
+cnt_restarts = metrics.counter("splitter_restarts_total", "re-starts after comm errors or Vitoconnect problems")
 
 
 # === polling =============================
-poll_pointer = 0
+poll_pointer = 0    # position in poll_plan
 poll_cycle = 0
-
-def do_poll_item(poll_data, ser:serial.serial_for_url, item_index:int=None) -> int:  # retcode      # type: ignore
-    # set item_index to force poll
-    global poll_pointer
+poll_plan = []      # list indexes of the items due in this poll cycle
+poll_data = []      # read values for viessdata.csv, same index as poll_list.items
+harvested = {}      # list index -> monotonic time the value was taken from a Vitoconnect response
+num_harvested = 0
+num_harvest_skips = 0
+cnt_poll_reads = metrics.counter("poll_reads_total", "poll reads (items and blocks) by return code", ("retcode",))
+
+def do_poll_item(poll_data, ser:serial.serial_for_url, list_index:int, forced:bool=False) -> int:  # retcode      # type: ignore
+    # list_index from poll_plan, set forced to poll single item (e.g. read back after write)
     val = "?"
     item = "?"
 
-#    print("do_poll_item",item_index)
+    bus_meter.source = "poll"
     try:
-        # handle PollCycle option +++++++++++++++++++++++
-        # loop though poll items until find one to be done this cycle
-        while(True):
-            list_index = item_index if item_index is not None else poll_pointer
-            item = poll_list.items[list_index]  # (PollCycleGroupKey, Name, DpAddr, Len, Scale/Type, Signed)
-            item_cycle = poll_list.cycle_groups[item[0]]
-
-            if(item_index is None) and ((item_cycle < 0) or ((item_cycle > 0) and (poll_cycle % item_cycle != 0)) or ((item_cycle == 0) and (poll_cycle != 0))):
-                # ---------------------------------------
-                # +++ do NOT poll this item this time +++
-                # ---------------------------------------
-
-                # leave poll_data[poll_pointer] unchanged
-
-                poll_pointer += 1
-                if(poll_pointer == poll_list.num_items):
-                    # no further item this cycle
-                    return 0xAB
+        # remove PollCycleGroupKey for further processing -> (Name, DpAddr, Len, Scale/Type, Signed)
+        item = poll_list.items[list_index][1:]
+
+        # block read of neighbouring items
+        if(not forced) and (list_index in poll_list.blocks):
+            retcode = do_poll_block(poll_data, ser, list_index)
+            cnt_poll_reads.inc(f"{retcode:02x}")
+            if(retcode != 0x03):
+                return retcode
+            # device refused the block, poll item by item from now on
+            poll_list.drop_block(list_index)
+            olbreath(retcode)
+
+        t_start = time.monotonic()
+        retcode, data, val, _ = requests_util.response_to_request(item, ser, poll_list.decoders[list_index])
+        dp_stats.read_done(list_index, item[0], item[1], retcode, time.monotonic() - t_start)
+        cnt_poll_reads.inc(f"{retcode:02x}")
 
-            else:
-                # remove PollCycleGroupKey for further processing
-                item = item[1:]
-                break
+        if(retcode == 0x01):
+            # requests for the same datapoint waiting in the bus queue get served with this
+            bus.complete_reads(item[1], int(item[2]), data)
+            harvested.pop(list_index, None)
 
-        retcode, data, val, _ = requests_util.response_to_request(item, ser)
+            take_poll_value(poll_data, list_index, val, forced)
 
-        if(retcode == 0x01):
-            # save val in buffer for csv
-            poll_data[list_index] = val
-
-            # post to MQTT broker
-            if(mod_mqtt is not None): 
-                mod_mqtt.publish_read(item[0], item[1], val)
-
-            # probably more bytebit values of the same datapoint?!
-            if(len(item) > 3):
-                if(str(item[3]).lower().startswith('b:')):
-                    # bytebit filter +++++++++
-                    while((list_index + 1) < poll_list.num_items):
-                        list_index += 1
-                        next_item = poll_list.items[list_index]
-                        #next_item_cycle = poll_list.cycle_groups[next_item[0]]
-                        # remove PollCycleGroupKey
-                        next_item = next_item[1:]
-                        
-                        # if next address same AND next len same AND next type starts with 'b:'
-                        if((len(next_item) > 3) and (next_item[1] == item[1]) and (next_item[2] == item[2]) and (str(next_item[3]).lower()).startswith('b:')):
-                            next_val = requests_util.perform_bytebit_filter_and_evaluate(data, next_item)
-
-                            # save val in buffer for csv
-                            poll_data[list_index] = next_val
-
-                            if(mod_mqtt is not None): 
-                                #if not ((next_item_cycle < 0) or ((next_item_cycle > 0) and (poll_cycle % next_item_cycle != 0)) or ((next_item_cycle == 0) and (poll_cycle != 0))):
-                                # publish to MQTT broker
-                                mod_mqtt.publish_read(next_item[0], next_item[1], next_val)
-
-                            poll_pointer = list_index
-                        else:
-                            break
+            # more bytebit values of the same datapoint
+            for next_index in poll_list.followers.get(list_index, ()):
+                take_poll_value(poll_data, next_index, poll_list.decoders[next_index].decode(data), forced)
         else:
-            logger.error(f"OL Error do_poll_item {poll_pointer}, Addr {item[1]:04X}, RetCode {retcode}, Data {val}")
+            logger.error(f"OL Error do_poll_item {list_index}, Addr {item[1]:04X}, RetCode {retcode}, Data {val}")
         return retcode
     except Exception as e:
-        logger.error(f"Error do_poll_item {poll_pointer}, {item}: {e}")
+        logger.error(f"Error do_poll_item {list_index}, {item}: {e}")
         raise
 
 
-# poll timer +++++++++++++++
-def on_polltimer():
-    global poll_pointer
-    if(poll_pointer > poll_list.num_items):
-        poll_pointer = 0
-    startPollTimer(settings.poll_interval)
-
-timer_pollinterval = threading.Timer(1.0, on_polltimer)
-
-def startPollTimer(secs:float):
-    global timer_pollinterval
-    timer_pollinterval.cancel()
-    timer_pollinterval = threading.Timer(secs, on_polltimer)
-    timer_pollinterval.start()
+def do_poll_block(poll_data, ser:serial.serial_for_url, list_index:int) -> int:  # retcode      # type: ignore
+    baddr, blen, members = poll_list.blocks[list_index]
+    t_start = time.monotonic()
+    retcode, _, data = vs12_adapter.read_datapoint_ext(baddr, blen, ser)
+    rtt = time.monotonic() - t_start
+    for idx in members:
+        # (PollCycleGroupKey, Name, DpAddr, ...)
+        dp_stats.read_done(idx, poll_list.items[idx][1], poll_list.items[idx][2], retcode, rtt)
+    if(retcode != 0x01) or (len(data) < blen):
+        logger.error(f"OL Error do_poll_block {list_index}, Addr {baddr:04X}, Len {blen}, RetCode {retcode}, Data {utils.bbbstr(data)}")
+        return retcode if (retcode != 0x01) else 0xFD
+    dp_cache.put(baddr, blen, data)
+    bus.complete_reads(baddr, blen, data)
+    for idx in members:
+        # remove PollCycleGroupKey -> (Name, DpAddr, Len, ...)
+        item = poll_list.items[idx][1:]
+        offs = item[1] - baddr
+        itemdata = data[offs:offs + int(item[2])]
+        dp_cache.put(item[1], int(item[2]), itemdata)
+        bus.complete_reads(item[1], int(item[2]), itemdata)
+        harvested.pop(idx, None)
+        take_poll_value(poll_data, idx, poll_list.decoders[idx].decode(itemdata))
+        # more bytebit values of the same datapoint, not being members themselves (other cycle group)
+        for next_index in poll_list.followers.get(idx, ()):
+            if next_index not in members:
+                take_poll_value(poll_data, next_index, poll_list.decoders[next_index].decode(itemdata))
+    return retcode
+
+
+def take_poll_value(poll_data, list_index:int, val, forced:bool=False):
+    """ new value of a poll item: csv buffer, value store, MQTT (forced: read back, published in any case) """
+    # (PollCycleGroupKey, Name, DpAddr, ...)
+    item = poll_list.items[list_index]
+    # save val in buffer for csv
+    if(list_index < len(poll_data)):
+        poll_data[list_index] = val
+    values.set(item[1], item[2], val)
+    dp_stats.value(list_index, item[1], item[2], val)
+    # post to MQTT broker
+    if(mod_mqtt is not None): 
+        policy = poll_list.publish_policies[list_index]
+        if(policy is None):
+            mod_mqtt.publish_read(item[1], item[2], val)
+        elif forced:
+            policy.published(val)
+            mod_mqtt.publish_read(item[1], item[2], val, force=True)
+        elif (how := policy.check(val)):
+            # 2: heartbeat, even if unchanged
+            mod_mqtt.publish_read(item[1], item[2], val, force=(how == 2))
 
 
 def olbreath(retcode:int):
@@ -171,6 +194,80 @@ def olbreath(retcode:int):
         time.sleep(2 * settings.olbreath)
 
 
+# Vicon request +++++++++++++++++++++++++++++
+hist_vicon_wait = metrics.histogram("vicon_wait_seconds", "Vitoconnect request received until sent to Optolink")
+hist_vicon_roundtrip = metrics.histogram("vicon_roundtrip_seconds", "Vitoconnect request received until response passed back")
+
+def do_vicon_request(serOpto, serVicon, publ_callback=None) -> bool:  # True if a request was served
+    vidata, t_recd = viconn_util.get_vicon_request()
+    if(not vidata):
+        return False
+    t_start = time.monotonic()
+    bus_meter.source = "vicon"
+    serOpto.reset_input_buffer()
+    serOpto.write(vidata)
+    viconnlog.do_log(vidata, "M")
+    # recive response an pass bytes directly back to VitoConnect, 
+    # returns when response is complete (or error or timeout) 
+    retcode, _, redata = vs12_adapter.receive_telegr(True, True, serOpto, serVicon, publ_callback)
+    t_end = time.monotonic()
+    viconnlog.do_log(redata, f"S {retcode:02x}")
+    hist_vicon_wait.observe(t_start - t_recd)
+    hist_vicon_roundtrip.observe(t_end - t_recd)
+    olbreath(retcode)
+    return True
+
+def do_vicon_request_idle(serOpto, serVicon, publ_callback=None) -> bool:
+    # served while a poll waits for 1-wire sensors, bus meter source of the poll kept
+    source = bus_meter.source
+    try:
+        return do_vicon_request(serOpto, serVicon, publ_callback)
+    finally:
+        bus_meter.source = source
+
+
+def on_vicon_response(retcd, addr, data, msgid, msqn, fctcd, dlen):
+    """ callback of receive_telegr for responses passed to Vitoconnect """
+    if(retcd == 0x01) and ((msgid & 0x0F) == 0x01):
+        if(fctcd == 0x01):
+            # Virtual_READ response, fresh data
+            dp_cache.put(addr, dlen, data)
+            bus.complete_reads(addr, dlen, data)
+            if(settings.viconn_harvest):
+                harvest_vicon_read(addr, data)
+        elif(fctcd == 0x02):
+            # Virtual_WRITE done
+            dp_cache.invalidate(addr, dlen)
+    if(settings.viconn_to_mqtt):
+        mqtt_publ_viconn(retcd, addr, data, msgid, msqn, fctcd, dlen)
+
+
+def harvest_vicon_read(addr:int, data):
+    """ poll items covered by a Virtual_READ response take their value from it """
+    global num_harvested
+    now = time.monotonic()
+    for idx in poll_list.find_covered(addr, len(data)):
+        # remove PollCycleGroupKey -> (Name, DpAddr, Len, ...)
+        item = poll_list.items[idx][1:]
+        offs = item[1] - addr
+        take_poll_value(poll_data, idx, poll_list.decoders[idx].decode(data[offs:offs + int(item[2])]))
+        harvested[idx] = now
+        num_harvested += 1
+
+
+def take_harvested(list_index:int) -> bool:
+    """ True if the poll item (all of its block) got fresh from Vitoconnect since the previous cycle, counts as polled """
+    global num_harvest_skips
+    since = poll_scheduler.due - max(settings.poll_interval, 0)
+    members = poll_list.blocks[list_index][2] if (list_index in poll_list.blocks) else [list_index]
+    if any(harvested.get(idx, -1.0) < since for idx in members):
+        return False
+    for idx in members:
+        del harvested[idx]
+    num_harvest_skips += 1
+    return True
+
+
 # Vicon listener +++++++++++++++++++++++++++++
 def vicon_thread_func(serViCon, serViDev):
     """
@@ -188,6 +285,7 @@ def vicon_thread_func(serViCon, serViDev):
         mqtt_publ_debug(msg)
         viconn_util.exit_flag = True
         utils.restart_event.set()  # Hauptprogramm signalisiert, dass ein Neustart noetig ist
+        utils.wakeup_event.set()
         return  # Thread wird beendet
 
 
@@ -197,12 +295,17 @@ def tcp_connection_loop():
     while(not progr_exit_flag):
         tcp_server = c_tcpserver.TcpServer("0.0.0.0", settings.tcpip_port, settings.tcp_verbose)
         tcp_server.command_callback = do_special_command        # type: ignore
+        tcp_server.request_callback = submit_tcp_request        # type: ignore
         tcp_server.run()
         tcp_server = None
         if progr_exit_flag: return
         #logger.info("TCP session closed, restart soon...")
         time.sleep(1)
 
+def submit_tcp_request(msg:str):
+    # TCP server passes the response back to the client the request came from
+    return bus.submit(msg, source="TCP")
+
 
 # utils +++++++++++++++++++++++++++++
 def do_special_command(cmnd:str, source:int=1) -> bool:  # source: 1:MQTT, 2:TCP, 0:no response
@@ -227,9 +330,37 @@ def do_special_command(cmnd:str, source:int=1) -> bool:  # source: 1:MQTT, 2:TCP
             resp = f"{parts[0]} triggered"
         elif parts[0] in ('stats', 'getstats'):   
             resp = get_stats()
+        elif parts[0] in ('dpstats',):
+            # per poll item rtt, errors, changes
+            opt = parts[1] if len(parts) > 1 else ''
+            if(opt == 'csv'):
+                resp = dp_stats.to_csv()
+            elif(opt == 'save'):
+                resp = f"dpstats written to {dp_stats.save()}"
+            elif(opt == 'reset'):
+                dp_stats.reset()
+                resp = "dpstats cleared"
+            else:
+                resp = dp_stats.to_json()
+        elif parts[0] in ('resetbreaker',):
+            # failing poll items back to normal polling
+            if len(parts) > 1:
+                indices = [idx for idx, item in enumerate(poll_list.items) if item[1] == parts[1]]
+                if not indices:
+                    raise Exception(f"unknown poll item {parts[1]}")
+                num = sum(poll_breaker.reset(idx) for idx in indices)
+            else:
+                num = poll_breaker.reset()
+            resp = f"{num} breaker(s) closed"
+        elif parts[0] in ('latency', 'viconstats'):   
+            resp = json.dumps(metrics.as_dict() | {"vicon_queue" : viconn_util.get_queue_stats()})
         elif parts[0] in ("exit", "resettcp"):
             if tcp_server:
-                tcp_server.stop()
+                if(source == 2) and (parts[0] == "exit"):
+                    # only the session asking
+                    tcp_server.close_client()
+                else:
+                    tcp_server.stop()
                 resp = f"{parts[0]} triggered" if source != 2 else ''
         elif parts[0] in ("flushcsv",):
             if settings.write_viessdata_csv:
@@ -247,6 +378,8 @@ def do_special_command(cmnd:str, source:int=1) -> bool:  # source: 1:MQTT, 2:TCP
             resp = f"poll_interval set to {parts[1]}"
         else:
             return False
+        # flags get handled by the main loop
+        utils.wakeup_event.set()
     except Exception as e:
         resp = str(e)
     # responde
@@ -271,21 +404,24 @@ def get_stats() -> str:
             "Splitter started" : str(time.strftime("%Y-%m-%d %H:%M:%S", time.localtime(splitter_started))),
             "Settings Make" : str(utils.get_module_modified_datetime(settings._settings_obj)) if settings._settings_obj else "0", 
             "Poll List Make" : str(poll_list.module_date),
-            "Poll List Items" : str(poll_list.num_items)}
+            "Poll List Items" : str(poll_list.num_items),
+            "Poll Cycles" : poll_scheduler.get_stats(),
+            "DP Cache" : dp_cache.get_stats(),
+            "Bus" : bus.get_stats(),
+            "Vicon Harvest" : {"values" : num_harvested, "polls_saved" : num_harvest_skips},
+            "Poll Breakers" : poll_breaker.get_stats(lambda idx: poll_list.items[idx][1]),
+            "Tasks" : task_scheduler.get_stats()}
     return json.dumps(jdata)
 
 
 def reset_retry_counters_in(delay_minutes=30):
-    # Achtung! blockiert Ctrl+C etc
-    global num_restarts, num_vicon_tries
-    
+    # done by the main loop, so only after successful operation
     def reset_counters():
         global num_restarts, num_vicon_tries
         num_restarts = 0
         num_vicon_tries = 0
 
-    timer = threading.Timer(delay_minutes * 60, reset_counters)
-    timer.start()
+    task_scheduler.call_later(delay_minutes * 60, reset_counters, key="reset_retry_counters")
 
 
 def mqtt_publ_debug(msg:str):
@@ -422,8 +558,8 @@ def handle_exit(sig, frame):
 # Main
 # ------------------------
 def main():
-    global mod_mqtt
-    global poll_pointer, poll_cycle
+    global mod_mqtt, http_server
+    global poll_pointer, poll_cycle, poll_plan, poll_data
     global force_poll_flag, reload_poll_flag
     global num_restarts, num_vicon_tries, progr_exit_flag
 
@@ -438,7 +574,6 @@ def main():
 
     excptn = None
     first_time = True
-    reset_retry_counters_time = -1
 
 
     # === the method for a clean exit =============================
@@ -452,10 +587,14 @@ def main():
         progr_exit_flag = True
         # Schliessen der seriellen Schnittstellen, Ausgabedatei, PollTimer, 
         logger.info("exit close...")
-        logger.info("cancel poll timer") 
-        timer_pollinterval.cancel()
+        poll_scheduler.stop()
         if(tcp_server is not None):
             tcp_server.stop()
+        if utils.shutdown_event.is_set():
+            # nobody will serve them anymore
+            bus.cancel_all()
+            if(http_server is not None):
+                http_server.stop()
         viconn_util.exit_flag = True
         if(serVitoConnnect is not None):
             logger.info("closing serVitoConnnect")
@@ -493,19 +632,25 @@ def main():
                 # buffer for read data for writing viessdata.csv 
                 poll_data = [None] * poll_list.num_items
 
+                # HTTP API, served from memory, keeps running through re-starts
+                if(settings.http_port is not None):
+                    http_server = c_httpserver.HttpServer("0.0.0.0", settings.http_port)
+                    http_server.stats_callback = get_stats
+                    threading.Thread(target=http_server.run, daemon=True).start()
+
                 utils.shutdown_event.clear()
                 first_time = False
             else:
                 # === this is a re-start ======
                 num_restarts += 1
+                cnt_restarts.inc()
                 if num_vicon_tries > settings.max_vicon_tries:
                     # continue without vitoconnect 
                     settings.port_vitoconnect = None
                 progr_exit_flag = False
                 utils.restart_event.clear()
                 excptn = None
-                #reset_retry_counters_in(settings.retry_counters_reset)
-                reset_retry_counters_time = time.monotonic() + (60 * settings.retry_counters_reset)
+                reset_retry_counters_in(settings.retry_counters_reset)
                 logger.warning(f"re-start #{num_restarts}")
 
             # ---------------------
@@ -578,9 +723,10 @@ def main():
 
             # one wire value check init
             requests_util.init_w1_values_check()
+            onewire_util.idle_callback = None
 
-            # publish viconn or not
-            vicon_publ_callback = mqtt_publ_viconn if settings.viconn_to_mqtt else None
+            # Vitoconnect responses: cache, publish viconn or not
+            vicon_publ_callback = on_vicon_response
 
             # show what we have
             publish_stats()
@@ -593,7 +739,7 @@ def main():
                 num_vicon_tries += 1
 
                 # reset vicon_request buffer
-                viconn_util.vicon_request = bytearray()
+                viconn_util.clear_vicon_requests()
 
                 # Vitoconncet logging
                 if(settings.log_vitoconnect):
@@ -614,6 +760,10 @@ def main():
                 vicon_thread = threading.Thread(target=vicon_thread_func, args=(serVitoConnnect, serOptolink), daemon=True)
                 vicon_thread.start()
 
+                # serve Vitoconnect while waiting for 1-wire sensors
+                if(settings.viconn_strict_priority):
+                    onewire_util.idle_callback = lambda: do_vicon_request_idle(serOptolink, serVitoConnnect, vicon_publ_callback)
+
             else:
                 # Protokoll/Kommunikation am Slave initialisieren
                 spr = "VS2/300" if not settings.vs1protocol else "VS1/KW"
@@ -623,12 +773,14 @@ def main():
 
 
             # Polling Mechanismus --------
-            if(settings.poll_interval > 0) and (poll_list.num_items > 0):
-                startPollTimer(settings.poll_interval)
+            if(poll_list.num_items > 0):
+                poll_scheduler.start()
 
             # main loop initialisieren --------
-            num_tasks = 3
+            bus_sources = ("MQTT", "TCP")   # each its own slot, a burst of one does not delay the other
+            num_tasks = 1 + len(bus_sources)   # polling, bus requests of each source
             request_pointer = 0
+            energy_due = False
             #tprev = int(time.time()*10000)
             logger.info("enter main loop")
 
@@ -642,19 +794,12 @@ def main():
                 retcode = 1
                 is_on = request_pointer
 
+                # delayed tasks due (read back after /set, ...)
+                task_scheduler.run_due()
+
                 ### first Vitoconnect request -------------------
                 if(serVitoConnnect is not None):
-                    vidata = viconn_util.get_vicon_request()
-                    if(vidata):
-                        serOptolink.reset_input_buffer()
-                        serOptolink.write(vidata)
-                        viconnlog.do_log(vidata, "M")
-                        # recive response an pass bytes directly back to VitoConnect, 
-                        # returns when response is complete (or error or timeout) 
-                        retcode, _, redata = vs12_adapter.receive_telegr(True, True, serOptolink, serVitoConnnect, vicon_publ_callback)     # type: ignore
-                        viconnlog.do_log(redata, f"S {retcode:02x}")
-                        olbreath(retcode)
-                        did_vicon_request = True
+                    did_vicon_request = do_vicon_request(serOptolink, serVitoConnnect, vicon_publ_callback)
 
                 ### secondary requests ------------------
                 #TODO ueberlegen/testen, ob Vitoconnect request nicht auch in der Reihe reicht
@@ -679,6 +824,13 @@ def main():
                                 poll_list.make_list(reload=True)
                                 if(len(poll_data) != poll_list.num_items):          # type: ignore
                                     poll_data = [None] * poll_list.num_items
+                                # debounced /set and read backs refer to indexes of the former list
+                                task_scheduler.cancel_kind("set")
+                                task_scheduler.cancel_kind("readback")
+                                harvested.clear()
+                                values.clear()
+                                dp_stats.reset()
+                                poll_breaker.reset()
                                 publish_stats()
                                 poll_pointer = 0
                                 poll_cycle = 0
@@ -686,29 +838,58 @@ def main():
                                 if(mod_mqtt): 
                                     mod_mqtt.lst_force_refresh = []     # type: ignore
 
+                            # === next poll cycle due? =================
+                            if(poll_pointer > len(poll_plan)) and poll_scheduler.is_due():
+                                poll_pointer = 0
+
+                            # === wo1c energy, own step to not keep Vitoconnect waiting =================
+                            if energy_due:
+                                bus_meter.source = "energy"
+                                retcode = wo1c_energy.read_energy(serOptolink)      # type: ignore
+                                energy_due = False
+                                did_secodary_request = True
+
                             # === check if something is forced =================
-                            if mod_mqtt and ((force_refresh_index := mod_mqtt.is_forced()) is not None):
-                                retcode = do_poll_item(poll_data, serOptolink, item_index=force_refresh_index)      # type: ignore
+                            elif mod_mqtt and ((force_refresh_index := mod_mqtt.is_forced()) is not None):
+                                retcode = do_poll_item(poll_data, serOptolink, force_refresh_index, forced=True)      # type: ignore
+                                poll_breaker.record(force_refresh_index, retcode, poll_list.items[force_refresh_index][1])
+                                # read back not to wait for the poll cycle end (mqtt_publish_mode json)
+                                mod_mqtt.publish_collected()
                                 # we did something
                                 did_secodary_request = True
 
                             # === else do common poll if is on =================
-                            elif(0 <= poll_pointer < poll_list.num_items):
-                                retcode = do_poll_item(poll_data, serOptolink)      # type: ignore
-                                # increment poll pointer
-                                poll_pointer += 1
+                            elif(0 <= poll_pointer <= len(poll_plan)):
+                                if(poll_pointer == 0):
+                                    # new cycle, get the items due
+                                    poll_plan = poll_list.get_plan(poll_cycle)
+                                    poll_scheduler.cycle_started()
+                                    retcode = 0xAB  # nothing done yet
+                                if(poll_pointer < len(poll_plan)):
+                                    if harvested and take_harvested(poll_plan[poll_pointer]):
+                                        retcode = 0xAB  # fresh from Vitoconnect, no need to poll
+                                    elif poll_breaker.skip(poll_plan[poll_pointer]):
+                                        retcode = 0xAB  # failing again and again, probed later
+                                    else:
+                                        retcode = do_poll_item(poll_data, serOptolink, poll_plan[poll_pointer])      # type: ignore
+                                        poll_breaker.record(poll_plan[poll_pointer], retcode, poll_list.items[poll_plan[poll_pointer]][1])
+                                    # increment poll pointer
+                                    poll_pointer += 1
 
                                 # +++ everything to be done after poll cycle completed ++++++++++
-                                if(poll_pointer >= poll_list.num_items):
+                                if(poll_pointer >= len(poll_plan)):
+                                    # JSON of the values changed this cycle (mqtt_publish_mode json)
+                                    if(mod_mqtt is not None):
+                                        mod_mqtt.publish_collected()
+
                                     # Viessdata csv
                                     if(settings.write_viessdata_csv):
                                         viessdata_util.buffer_csv_line(poll_data)       # type: ignore
                                     
-                                    # wo1c energy
+                                    # wo1c energy, done next time
                                     if(settings.wo1c_energy > 0) and (poll_cycle % settings.wo1c_energy == 0):
                                         if(not settings.vs1protocol):
-                                            olbreath(retcode)
-                                            retcode = wo1c_energy.read_energy(serOptolink)      # type: ignore
+                                            energy_due = True
                                         else:
                                             logger.warning("wo1c_energy not supported with VS1/KW protocol")
                                             settings.wo1c_energy = 0
@@ -718,41 +899,19 @@ def main():
                                     if(poll_cycle == 479001600):  # 1*2*3*4*5*6*7*8*9*10*11*12 < 32 bits
                                         poll_cycle = 0
 
-                                    # poll pointer control
-                                    poll_pointer += 1  # wegen  on_polltimer(): if(poll_pointer > poll_list.num_items)
-                                    if(settings.poll_interval == 0):
-                                        # continuous polling
-                                        poll_pointer = 0  # else: poll_pointer gets reset by timer
+                                    # poll pointer control, next cycle when due
+                                    poll_pointer = len(poll_plan) + 1
+                                    poll_scheduler.cycle_done()
                                 
                                 # we did something
                                 did_secodary_request = True
 
-                    # MQTT request --------
-                    elif(is_on == 1):
-                        if(mod_mqtt is not None):
-                            msg = mod_mqtt.get_mqtt_request()
-                            if(msg):
-                                try:
-                                    retcode, _, _, resp = requests_util.response_to_request(msg, serOptolink)
-                                    mod_mqtt.publish_response(resp)
-                                except Exception as e:
-                                    mod_mqtt.publish_response(f"Error: {e}")
-                                    logger.warning(f"Error handling MQTT request {msg}: {e}")
-                                did_secodary_request = True
-
-                    # TCP/IP request --------
-                    elif(is_on == 2):
-                        if(tcp_server is not None):
-                            msg = tcp_server.get_request()
-                            if(msg):
-                                #print(f"recd tcp msg: {msg}")  #temp
-                                try:
-                                    retcode, _, _, resp = requests_util.response_to_request(msg, serOptolink)
-                                    #print(f"retcode {retcode}, try to send tcp: {resp}")  #temp
-                                    tcp_server.send(resp)
-                                except Exception as e:
-                                    logger.warning(f"Error handling TCP request {msg}: {e}")
-                                did_secodary_request = True
+                    # queued requests of MQTT, TCP --------
+                    else:
+                        req = bus.get_nowait(bus_sources[is_on - 1])
+                        if(req is not None):
+                            retcode = bus.execute(req, serOptolink)
+                            did_secodary_request = True
         
                     #print(f"{((tnow := int(time.time()*10000)) - tprev)} ds {did_secodary_request}"); tprev = tnow
                             
@@ -767,19 +926,20 @@ def main():
                 # keep-alive with vs1 
                 if(settings.vs1protocol):
                     if(time.monotonic() > last_vs1_comm + 0.5):
+                        bus_meter.source = "keepalive"
                         retcode,_,_ = vs12_adapter.read_datapoint_ext(0xf8, 2, serOptolink)     # type: ignore
                         olbreath(retcode)
                         did_secodary_request = True
 
-                # let cpu take a breath if there was nothing to do
+                # sleep if there was nothing to do until something comes in 
+                # (Vitoconnect, bus requests, poll timer, forced refresh, action commands)
                 if not (did_vicon_request or did_secodary_request):
-                    time.sleep(0.005) 
-                
-                # reset retry couters in case
-                if(reset_retry_counters_time > 0) and (time.monotonic() >= reset_retry_counters_time):
-                    num_restarts = 0 
-                    num_vicon_tries = 0
-                    reset_retry_counters_time = -1
+                    idle_timeout = min(IDLE_TIMEOUT, poll_scheduler.time_to_due(), task_scheduler.time_to_next())
+                    if(settings.vs1protocol):
+                        # keep-alive due
+                        idle_timeout = min(idle_timeout, max(0.0, last_vs1_comm + 0.5 - time.monotonic()))
+                    utils.wakeup_event.wait(idle_timeout)
+                    utils.wakeup_event.clear()
                 
         except Exception as e:
             logger.exception("main")
@@ -15,6 +15,7 @@
 '''
 
 from typing import Any
+import json
 
 from c_settings_adapter import settings
 from logger_util import logger
@@ -22,6 +23,8 @@ import utils
 import vs12_adapter
 import onewire_util
 import c_w1value
+from c_decoder import get_decoder
+from c_dpcache import dp_cache
 
 
 
@@ -40,99 +43,6 @@ def init_w1_values_check():
         w1values[addr] = w1val
 
 
-def get_value(data, frmat, signd:bool):
-    scale = utils.to_number(frmat)
-    if(scale is not None):
-        return utils.bytesval(data, scale, signd)
-    else:
-        #TODO hier evtl weitere Formate umsetzen
-        frmatl = str(frmat).lower()
-        if(frmatl == 'vdatetime'):
-            return utils.vdatetime2str(data)
-        elif(frmatl == 'vcaldatetime'):
-            return utils.vdatetime2str(data, 0)
-        elif(frmatl == 'unixtime'):
-            return utils.unixtime2str(data)
-        elif(frmatl == 'schedvdens'):
-            return utils.schedvdens2str(data)
-        elif(frmatl == 'schedvcal'):
-            return utils.schedulevcal2str(data)
-        elif(frmatl == 'utf8'):
-            return utils.utf82str(data)
-        elif(frmatl == 'utf16'):
-            return utils.utf162str(data)
-        elif(frmatl == 'bool'):
-            return str(utils.bytesval(data) != 0)
-        elif(frmatl == 'boolinv'):
-            return str(utils.bytesval(data) == 0)
-        elif(frmatl == 'onoff'):
-            return 'ON' if(utils.bytesval(data) != 0) else 'OFF'
-        elif(frmatl == 'offon'):
-            return 'ON' if(utils.bytesval(data) == 0) else 'OFF'
-        elif(frmatl == 'bin'):
-            ffrmt = f"0{len(data)*8}b"
-            return f"{utils.bytesval(data):{ffrmt}}"
-        elif(frmatl.startswith('f:')):
-            ffrmt = frmat[2:]
-            return f"{utils.bytesval(data):{ffrmt}}"
-        else:
-            if(frmatl != 'raw'):
-                logger.error(f"unknown format specifier: {frmat}")
-            #return raw
-            return utils.arr2hexstr(data)
-
-def perform_bytebit_filter(data, item):
-    # item is poll list entry:  (Name, DpAddr, Len, 'b:startbyte:lastbyte:bitmask:endian', Scale, Signed) # PollCycleGroupKey removed!
-    # may also be read request: "read; DpAddr; Len; 'b:startbyte:lastbyte:bitmask:endian'; Scale; Signed"
-
-    bparts = item[3].split(':')
-
-    bstart = int(bparts[1])
-    bend = bstart
-    if(len(bparts) > 2):
-        if(bparts[2] != ''):
-            bend = int(bparts[2])
-
-    udata = data[bstart:(bend+1)]
-    dlen = bend - bstart + 1
-
-    # first apply mask if given
-    if(len(bparts) > 3):
-        if(bparts[3] != ''):
-            smask = str(bparts[3]).strip()
-            imask = utils.get_int(smask)
-            amask = bytearray(imask.to_bytes(dlen, 'big'))
-            # now apply the mask byte for byte
-            for i in range(dlen):
-                udata[i] = udata[i] & amask[i]
-
-    # evaluate endian if given
-    if(len(bparts) > 4) and (bparts[4] == 'big'):
-        # convert to int
-        ival = int.from_bytes(udata, byteorder='big')
-        # convert to bytearray to get evaluated in response_to_request()
-        return bytearray(ival.to_bytes(dlen, byteorder='little'))
-    else:  # also covers 'raw' for backward compatibility
-        return udata
- 
-def perform_bytebit_filter_and_evaluate(data, parts):
-    # parts: ['valname/read', addr, len, 'b:...', fact, signd]   min up to 'b:...'
-    valdata = perform_bytebit_filter(data, parts)
-    numelms = len(parts)
-    if(numelms > 4):
-        # factor is parts[4]
-        # eval signed
-        signd = False
-        if(numelms > 5):
-            signd = utils.get_bool(parts[5])
-        # now get value 
-        val = get_value(valdata, parts[4], signd)
-    else:
-        # return raw
-        val = utils.arr2hexstr(valdata)
-    return val
-
-
 def get_retstr(retcode, addr, val) -> str:
     prefix = '' #'0x' if('x' in settings.retcode_format.lower()) else '' 
     sretcode = prefix + format(retcode, settings.retcode_format)
@@ -141,13 +51,184 @@ def get_retstr(retcode, addr, val) -> str:
     return f"{sretcode};{saddr};{val}"
 
 
+# datapoint cache +++++++++++++++++++++++++++++
+def pop_maxage(parts:list):  # seconds or None
+    # removes 'maxage=<seconds>' from the request parts
+    maxage = None
+    for part in parts[1:]:
+        if str(part).lower().startswith('maxage='):
+            maxage = float(part[7:])
+            parts.remove(part)
+            break
+    return maxage
+
+
+def read_from_cache(parts:list, maxage:float, count:bool=True):  # retcode, data, value, string_to_pass or None
+    # count: hit or miss into the cache stats, once per request
+    addr = utils.get_int(parts[1])
+    if(addr in settings.w1sensors):
+        return None
+    data = dp_cache.get(addr, int(parts[2]), maxage)
+    if(data is None):
+        if count:
+            dp_cache.misses += 1
+        return None
+    if count:
+        dp_cache.hits += 1
+    val = get_decoder(tuple(parts[3:])).decode(data)
+    return 0x01, data, val, get_retstr(0x01, addr, val)
+
+
+def response_from_cache(request:str):  # retcode, data, value, string_to_pass or None
+    # read request with maxage, answered without bus traffic if cached
+    parts = request.split(';')
+    if(len(parts) < 3) or (parts[0].lower() not in ("read", "r")):
+        return None
+    try:
+        maxage = pop_maxage(parts)
+        if(maxage is None):
+            return None
+        return read_from_cache(parts, maxage)
+    except ValueError:
+        # malformed, leave it to response_to_request to tell
+        return None
+
+
+# shared reads +++++++++++++++++++++++++++++
+def get_read_key(request):  # (addr, len) of a datapoint read request or None
+    parts = request.split(';') if isinstance(request, str) else list(request)
+    if(len(parts) < 3) or (str(parts[0]).lower() not in ("read", "r")):
+        return None
+    try:
+        pop_maxage(parts)
+        addr = utils.get_int(parts[1])
+        rlen = int(parts[2])
+    except ValueError:
+        return None
+    if(addr in settings.w1sensors):
+        return None
+    return (addr, rlen)
+
+def get_write_addr(request):  # addr of a datapoint write request or None
+    parts = request.split(';') if isinstance(request, str) else list(request)
+    if(len(parts) < 3) or (str(parts[0]).lower() not in ("write", "w", "writeraw", "wraw")):
+        return None
+    try:
+        return utils.get_int(parts[1])
+    except ValueError:
+        return None
+
+
+def response_from_data(request, retcode:int, data) -> tuple[int, bytearray, Any, str]:   # retcode, data, value, string_to_pass 
+    # response to a read request served by the bus transaction of another one
+    parts = request.split(';') if isinstance(request, str) else list(request)
+    pop_maxage(parts)
+    addr = utils.get_int(parts[1])
+    if(retcode == 0x01):
+        val = get_decoder(tuple(parts[3:])).decode(data)
+    elif(data):
+        val = utils.arr2hexstr(data)
+    else:
+        val = "?"
+    return retcode, data, val, get_retstr(retcode, addr, val)
+
+
+# batch read +++++++++++++++++++++++++++++
+def parse_readmulti(parts:list) -> list:  # [(addr, len, format spec)]
+    # parts: ['readmulti', addr, len, Scale/Type, addr, len, Scale/Type, ...], empty Scale/Type -> raw
+    if(len(parts) < 4) or ((len(parts) - 1) % 3 != 0):
+        raise ValueError("readmulti needs DpAddr;Len;Scale/Type triples")
+    return [(utils.get_int(parts[i]), int(parts[i + 1]), (parts[i + 2],) if parts[i + 2] else ())
+            for i in range(1, len(parts), 3)]
+
+def parse_readmulti_json(request:str) -> list:  # [(addr, len, format spec)]
+    # '[["0x0800", 2, 0.1, true], [2050, 2, "raw"], ["0x2500", 22, "b:16:16", "bool"]]'
+    # each entry like a poll list item without name: DpAddr, Len, ['b:...',] [Scale/Type [, Signed]]
+    entries = json.loads(request)
+    if(not isinstance(entries, list)) or (not entries) \
+            or not all(isinstance(entry, list) and (len(entry) > 1) for entry in entries):
+        raise ValueError("JSON array of [DpAddr, Len, ...] entries expected")
+    return [(utils.get_int(entry[0]), int(entry[1]), tuple(entry[2:])) for entry in entries]
+
+
+def make_read_blocks(items:list) -> list:  # [(BlockAddr, BlockLen, [item indexes])]
+    """ group the items into reads, neighbouring addresses into one block read if poll_block_read is enabled """
+    order = sorted(range(len(items)), key=lambda i: (items[i][0], items[i][1]))
+    if not settings.poll_block_read:
+        return [(items[i][0], items[i][1], [i]) for i in order]
+    maxgap = int(settings.poll_block_maxgap)
+    maxlen = min(int(settings.poll_block_maxlen), 255)
+    blacklist = set(utils.get_int(a) for a in settings.poll_block_blacklist)
+
+    blocks = []
+    for i in order:
+        addr, rlen, _ = items[i]
+        blockable = (addr not in settings.w1sensors) and (addr not in blacklist) and (0 < rlen <= maxlen)
+        if blocks and blockable and blocks[-1][3]:
+            baddr, blen, members, _ = blocks[-1]
+            newlen = max(blen, addr + rlen - baddr)
+            if(addr - (baddr + blen) <= maxgap) and (newlen <= maxlen) \
+                    and not any((baddr + blen <= a < addr + rlen) for a in blacklist):
+                blocks[-1] = (baddr, newlen, members + [i], True)
+                continue
+        blocks.append((addr, rlen, [i], blockable))
+    return [block[:3] for block in blocks]
+
+
+def read_multi(items:list, serViDev) -> list:  # [(retcode, addr, value)], same order as items
+    results = [None] * len(items)
+
+    def read_single(i):
+        addr, rlen, spec = items[i]
+        retcode, _, val, _ = response_to_request(["read", addr, rlen] + list(spec), serViDev)
+        results[i] = (retcode, addr, val)
+
+    for baddr, blen, members in make_read_blocks(items):
+        if len(members) == 1:
+            read_single(members[0])
+            continue
+        retcode, _, data = vs12_adapter.read_datapoint_ext(baddr, blen, serViDev)
+        if(retcode == 0x01) and (len(data) >= blen):
+            dp_cache.put(baddr, blen, data)
+            for i in members:
+                addr, rlen, spec = items[i]
+                itemdata = data[addr - baddr:addr - baddr + rlen]
+                dp_cache.put(addr, rlen, itemdata)
+                results[i] = (retcode, addr, get_decoder(spec).decode(itemdata))
+        else:
+            # device refused the block (or whatever), one by one
+            logger.info(f"readmulti: block read 0x{baddr:04X}/{blen} failed (RetCode {retcode}), items read one by one")
+            for i in members:
+                read_single(i)
+    return results      # type: ignore
+
+
+def response_to_readmulti(items:list, serViDev, as_json:bool=False) -> tuple[int, bytearray, Any, str]:   # retcode, data, values, string_to_pass 
+    results = read_multi(items, serViDev)
+    # first error if any
+    retcode = next((res[0] for res in results if res[0] != 0x01), 0x01)
+    vals = [res[2] for res in results]
+    if as_json:
+        retstr = json.dumps([[res[0], get_retstr(res[0], res[1], '').split(';')[1], res[2]] for res in results])
+    else:
+        # retcode;addr;value triples
+        retstr = ";".join(get_retstr(*res) for res in results)
+    return retcode, bytearray(), vals, retstr
+
+
 # 'main' functions +++++++++++++++++++++++++++++
-def response_to_request(request, serViDev) -> tuple[int, bytearray, Any, str]:   # retcode, data, value, string_to_pass 
+def response_to_request(request, serViDev, decoder=None) -> tuple[int, bytearray, Any, str]:   # retcode, data, value, string_to_pass 
     # error handling in calling proc
+    # decoder: precompiled cDecoder of a poll item
     ispollitem = False
+    maxage = None
     if(isinstance(request, str)):
         # TCP, MQTT requests
+        if request.startswith('['):
+            # JSON array of datapoints to read
+            return response_to_readmulti(parse_readmulti_json(request), serViDev, as_json=True)
         parts = request.split(';')
+        maxage = pop_maxage(parts)
     else:
         # poll item
         ispollitem = True
@@ -165,7 +246,7 @@ def response_to_request(request, serViDev) -> tuple[int, bytearray, Any, str]:
         serViDev.reset_input_buffer()
         serViDev.write(bstr)
         #print("sent to OL:", utils.bbbstr(bstr))  #temp
-        retcode, data = vs12_adapter.receive_fullraw(settings.fullraw_eot_time, settings.fullraw_timeout, serViDev)
+        retcode, data = vs12_adapter.receive_fullraw(settings.fullraw_eot_time, settings.fullraw_timeout, serViDev, request=bstr)
         val = utils.arr2hexstr(data)
         retstr = str(val)
         #print(f"recd fr OL: {utils.bbbstr(data)}, retcode {retcode:02x}") #temp
@@ -193,23 +274,18 @@ def response_to_request(request, serViDev) -> tuple[int, bytearray, Any, str]:
                 val = w1values[addr].checked(val)
             else:
                 # Optolink item
-                retcode, addr, data = vs12_adapter.read_datapoint_ext(addr, int(parts[2]), serViDev)
+                if(maxage is not None):
+                    # filled meanwhile? hit or miss counted already when submitted
+                    cached = read_from_cache(parts, maxage, count=False)
+                    if(cached is not None):
+                        return cached
+                rlen = int(parts[2])
+                retcode, addr, data = vs12_adapter.read_datapoint_ext(addr, rlen, serViDev)
                 if(retcode==1):
-                    if(numelms > 3):
-                        if(str(parts[3]).startswith('b:')):
-                            # parts: ['valname/read', addr, len, 'b:...', fact, signd]
-                            val = perform_bytebit_filter_and_evaluate(data, parts)
-                        else:
-                            # factor is parts[3]
-                            # eval signed
-                            signd = False
-                            if(numelms > 4):
-                                signd = utils.get_bool(parts[4])
-                            # now get value 
-                            val = get_value(data, parts[3], signd)
-                    else:
-                        # return raw
-                        val = utils.arr2hexstr(data)
+                    dp_cache.put(addr, rlen, data)
+                    if(decoder is None):
+                        decoder = get_decoder(tuple(parts[3:]))
+                    val = decoder.decode(data)
                 elif(data):
                     # probably error message
                     val = utils.arr2hexstr(data)  #f"{int.from_bytes(data, 'little')} ({utils.bbbstr(data)})"
@@ -217,6 +293,10 @@ def response_to_request(request, serViDev) -> tuple[int, bytearray, Any, str]:
                     val = "?"
             retstr = get_retstr(retcode, addr, val)
 
+        elif(cmnd == "readmulti"):  # "readmulti;0x0800;2;0.1;0x0802;2;0.1;0x0804;2;raw"
+            # batch read +++++++++++++++++++
+            return response_to_readmulti(parse_readmulti(parts), serViDev)
+
         elif(cmnd in ["write", "w"]):  # "write;0x6300;1;48"
             # write +++++++++++++++++++
             #raise Exception("write noch nicht fertig") #TODO scaling und so
@@ -224,6 +304,7 @@ def response_to_request(request, serViDev) -> tuple[int, bytearray, Any, str]:
             bval = ival.to_bytes(int(parts[2]), 'little', signed=(ival < 0))
             retcode, addr, data = vs12_adapter.write_datapoint_ext(utils.get_int(parts[1]), bval, serViDev)
             if(retcode == 1): 
+                dp_cache.invalidate(addr, len(bval))
                 val = int.from_bytes(bval, 'little', signed=(ival < 0))
             elif(data):
                 # probably error message
@@ -238,6 +319,7 @@ def response_to_request(request, serViDev) -> tuple[int, bytearray, Any, str]:
             bval = utils.hexstr2arr(hexstr)
             retcode, addr, data = vs12_adapter.write_datapoint_ext(utils.get_int(parts[1]), bval, serViDev)
             if(retcode == 1): 
+                dp_cache.invalidate(addr, len(bval))
                 val = hexstr   #int.from_bytes(bval, 'big')
             elif(data):
                 # probably error message
@@ -18,6 +18,7 @@ from pathlib import Path
 from datetime import datetime
 from c_settings_adapter import settings
 from logger_util import logger
+from c_metrics import metrics
 import threading
 
 
@@ -25,17 +26,24 @@ import threading
 # Threading-Events zur Steuerung von Neustarts und Beenden
 restart_event = threading.Event()
 shutdown_event = threading.Event()
+# set by producers (Vitoconnect listener, bus requests) to wake up the main loop
+wakeup_event = threading.Event()
 
 
 comm_errors = 0
+cnt_comm_errors = metrics.counter("optolink_comm_errors_total", "Optolink communication errors (timeout, CRC, NACK, ...)")
+metrics.gauge("optolink_comm_error_level", "comm error score, re-start at 2 * max_comm_errors", lambda: comm_errors)
+
 def comm_error(is_error:bool):
     """Count OL comm errors and initiate re-start on threshold"""
     global comm_errors
     if is_error:
+        cnt_comm_errors.inc()
         comm_errors += 2
         if comm_errors >= 2 * settings.max_comm_errors:
             logger.error("Optolink comm error threshold reached - initiate re-start")
             restart_event.set()
+            wakeup_event.set()
     elif comm_errors > 0:
         comm_errors -= 1
 
@@ -16,10 +16,14 @@
 
 import serial
 import time
+import threading
+from collections import deque
 
 import utils
 import vs12_adapter
 from c_logging import viconnlog
+from c_vs2frame import cVS2FrameParser
+from c_metrics import metrics
 
 exit_flag = False
 
@@ -120,16 +124,40 @@ def detect_vs1(serVicon:serial.Serial, serOpto:serial.Serial, timeout:float) ->
 
 
 # viconn request mechanism -------------
-vicon_request = bytearray()
+# FIFO listener -> main loop, entries (data, monotonic time received completely)
+VICON_QUEUE_SIZE = 8
+
+vicon_queue = deque()
+vicon_lock = threading.Lock()
+num_requests = 0
+num_dropped = 0
+max_depth = 0
+metrics.gauge("vicon_queue_depth", "Vitoconnect requests waiting for the Optolink bus", lambda: len(vicon_queue))
+metrics.gauge("vicon_dropped", "Vitoconnect requests dropped on queue overflow since start", lambda: num_dropped)
+
+
+def put_vicon_request(data:bytearray):
+    global num_requests, num_dropped, max_depth
+    with vicon_lock:
+        if len(vicon_queue) >= VICON_QUEUE_SIZE:
+            # Vitoconnect gave up on the oldest long ago
+            vicon_queue.popleft()
+            num_dropped += 1
+        vicon_queue.append((data, time.monotonic()))
+        num_requests += 1
+        if len(vicon_queue) > max_depth:
+            max_depth = len(vicon_queue)
+    utils.wakeup_event.set()
+
 
 def listen_to_Vitoconnect(servicon:serial.Serial, pubcallback = None):
-    global vicon_request
     timeout = 0
+    # own parser, keeps bytes of a following request received together with the recent one
+    parser = cVS2FrameParser(resptelegr=False)
     while(not exit_flag):
-        #retcode, _, data = optolinkvs2.receive_telegr(False, True, servicon, mqtt_publ_callback=pubcallback)  # contains sleep(0.005)
-        retcode, _, data = vs12_adapter.receive_telegr(False, True, servicon, mqtt_publ_callback=pubcallback)  # contains sleep(0.005)
+        retcode, _, data = vs12_adapter.receive_telegr(False, True, servicon, mqtt_publ_callback=pubcallback, parser=parser)
         if(retcode == 0x01):
-            vicon_request = data
+            put_vicon_request(data)
             timeout = 0
         elif(retcode == 0xff) and (timeout < 1):
             timeout += 1
@@ -137,13 +165,25 @@ def listen_to_Vitoconnect(servicon:serial.Serial, pubcallback = None):
         else:
             viconnlog.do_log(data, f"X {retcode:02x}")
             # protocol reset request as preparation for the new VS2 detection (kommt wahscheinlich nicht durch, aber ...)
-            vicon_request = bytearray([0x04])
+            put_vicon_request(bytearray([0x04]))
             raise Exception(f"Error {retcode:02x} in receive_vs2telegr, data: {utils.bbbstr(data)}")
 
 
-def get_vicon_request() -> bytearray:
-    global vicon_request
-    ret = vicon_request
-    vicon_request = bytearray()
-    return ret
+def get_vicon_request() -> tuple[bytearray, float]:  # data, time received
+    with vicon_lock:
+        if vicon_queue:
+            return vicon_queue.popleft()
+    return bytearray(), 0.0
+
+def vicon_request_pending() -> bool:
+    return bool(vicon_queue)
+
+def clear_vicon_requests():
+    with vicon_lock:
+        vicon_queue.clear()
 
+def get_queue_stats() -> dict:
+    return {"requests" : num_requests,
+            "dropped" : num_dropped,
+            "max_depth" : max_depth,
+            "depth" : len(vicon_queue)}
@@ -38,7 +38,7 @@ def do_request(ser:serial.Serial, fctcode:int, addr:int, rlen:int, data:bytes=b'
         raise NotImplementedError("request command not supported with VS1/KW, use raw instead")
 
 
-def receive_telegr(resptelegr:bool, raw:bool, ser:serial.Serial, ser2:serial.Serial=None, mqtt_publ_callback=None) -> tuple[int, int, bytearray]:       # type: ignore
+def receive_telegr(resptelegr:bool, raw:bool, ser:serial.Serial, ser2:serial.Serial=None, mqtt_publ_callback=None, parser=None) -> tuple[int, int, bytearray]:       # type: ignore
     """
     Empfaengt ein Optolink-Telegramm als Antwort auf ein Optolink Request.
 
@@ -58,6 +58,8 @@ def receive_telegr(resptelegr:bool, raw:bool, ser:serial.Serial, ser2:serial.Ser
         Standardwert ist None.
     mqtt_publ_callback :
         Funktion zum Publizieren der (Vitoconnect) Daten auf MQTT
+    parser : cVS2FrameParser, optional
+        Eigener VS2 Parser (z. B. Vitoconnect Listener), bei VS1 ohne Bedeutung.
 
     Rueckgabewerte:
     ---------------
@@ -87,14 +89,21 @@ def receive_telegr(resptelegr:bool, raw:bool, ser:serial.Serial, ser2:serial.Ser
     Diese Funktion blockiert, bis das Telegramm vollstaendig empfangen oder ein Timeout erreicht wurde.
     """
     if(VS2):
-        return optolinkvs2.receive_telegr(resptelegr, raw, ser, ser2, mqtt_publ_callback)
+        return optolinkvs2.receive_telegr(resptelegr, raw, ser, ser2, mqtt_publ_callback, parser)
     else:
         return optolinkvs1.receive_telegr(resptelegr, raw, ser, ser2)
 
 
-def receive_fullraw(eot_time, timeout, ser:serial.Serial, ser2:serial.Serial=None) -> tuple[int, bytearray]:        # type: ignore
+def receive_fullraw(eot_time, timeout, ser:serial.Serial, ser2:serial.Serial=None, request=None) -> tuple[int, bytearray]:        # type: ignore
+    # request: the raw telegram sent, if given the end of the response gets detected by protocol
+    frame_end = None
+    if(request is not None):
+        if(VS2):
+            frame_end = optolinkvs2.fullraw_end_detector(request)
+        else:
+            frame_end = optolinkvs1.fullraw_end_detector(request)
     # same everywhere, only one to service
-    return optolinkvs2.receive_fullraw(eot_time, timeout, ser, ser2) 
+    return optolinkvs2.receive_fullraw(eot_time, timeout, ser, ser2, frame_end) 
     # if(VS2):
     #     return optolinkvs2.receive_fullraw(eot_time, timeout, ser, ser2) #, mqtt_publ_callback)
     # else: